@@ -0,0 +1,105 @@
+"""timing summaries and machine readable output shared by the benchmarks"""
+
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the checkout wins over whatever mist is installed, results belong to a commit
+sys.path.insert(0, os.path.join(REPOSITORY_DIR, "src"))
+
+DEFAULT_SIZES = [100, 1000, 10000]
+
+def parse_sizes(value: str) -> list[int]:
+    return [int(s.replace("k", "000")) for s in value.split(",") if s]
+
+def percentile(values: list[float], q: float) -> float | None:
+    """nearest rank, None when there is nothing to rank"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def summary(case: str, size: int, seconds: float, latencies: list[float] = None, **extra) -> dict:
+    """seconds is the wall time of the whole case, latencies are per item"""
+    result = {
+        "case": case,
+        "size": size,
+        "seconds": round(seconds, 4),
+        "throughput": round(size / seconds, 2) if seconds else None,
+    }
+    if latencies is not None:
+        for q in (50, 99):
+            value = percentile(latencies, q)
+            result[f"p{q}_ms"] = round(value * 1000, 3) if value is not None else None
+    result.update(extra)
+    return result
+
+def measure(run: Callable[[], object], setup: Callable[[], object] = None, repeat: int = 3) -> tuple[float, int]:
+    """
+    median seconds of repeat runs and peak bytes allocated by one more run
+
+    setup goes before every run and is not counted, memory is traced separately since tracing slows everything down
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return statistics.median(times), peak
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment(**options) -> dict:
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": options,
+    }
+
+def print_table(results: list[dict]):
+    columns = []
+    for r in results:
+        columns.extend(k for k in r if k not in columns)
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in columns}
+
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).rjust(widths[c]) for c in columns))
+
+def write_json(file: str, results: list[dict], **options):
+    """- goes to stdout"""
+    data = json.dumps({"environment": environment(**options), "results": results}, indent=1)
+    if file == "-":
+        print(data)
+        return
+    with open(file, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.write("\n")
@@ -0,0 +1,180 @@
+"""
+throughput and latency of enrichment, listing and downloads against the offline replay server
+
+    python scripts/bench/connectors.py --sizes 100,1k --latency 20 --error-rate 0.01 --json results.json
+
+cases:
+- obtain-youtube, obtain-soundcloud, obtain-bandcamp: metadata.obtain_many over that many tracks,
+  youtube ones walk the whole connector graph (last.fm and soundcloud matching included)
+- get-entries: listing of a fake playlist piped into enrichment, like fetch --tags
+- download: the listed tracks through a DownloadPool and the fake extractor, like merge
+
+per item latency is from the item entering the stage to its result, p50 and p99 of those are reported
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+
+import common
+import fake_ytdlp
+import replay
+
+from mist import Entry, shenanigans, metadata
+from mist.config import ConfigReader
+from mist.metadata import Source, net, yt, sc
+
+CASES = ["obtain-youtube", "obtain-soundcloud", "obtain-bandcamp", "get-entries", "download"]
+
+def configure(concurrency: int, keep_ratelimits: bool, retries: int):
+    settings = {
+        "core.concurrency": str(concurrency),
+        "ratelimit.retries": str(retries),
+    }
+    if not keep_ratelimits:
+        settings["ratelimit.rate"] = "0"
+
+    # no response cache, every run goes to the server
+    net.configure(ConfigReader(settings), None)
+
+def reset():
+    """connector state which would otherwise carry over between runs"""
+    yt._get_yt_channel_data.cache_clear()
+    sc._client_id = None
+
+def _items(source: Source, size: int) -> list[str]:
+    match source:
+        case Source.YOUTUBE:
+            return replay.video_ids("BENCH", size)
+        case Source.SOUNDCLOUD:
+            return [str(i * replay.CHANNELS + i % replay.CHANNELS) for i in range(size)]
+        case Source.BANDCAMP:
+            return [f"https://artist-{i % replay.CHANNELS}.bandcamp.com/track/track-{i}" for i in range(size)]
+    raise ValueError(source)
+
+def bench_obtain(source: Source, size: int, concurrency: int) -> dict:
+    items = _items(source, size)
+    started: dict[str, float] = {}
+    latencies = []
+    failed = 0
+
+    def listed():
+        for i in items:
+            started[i] = time.perf_counter()
+            yield i
+
+    def collected(item: str, result: Entry | None):
+        nonlocal failed
+        latencies.append(time.perf_counter() - started[item])
+        # visited only gets the connectors which went through cleanly
+        if result is None or not result.visited:
+            failed += 1
+
+    start = time.perf_counter()
+    metadata.obtain_many(source, listed(), max_in_flight=concurrency, on_result=collected)
+    return common.summary(f"obtain-{source.name}", size, time.perf_counter() - start, latencies, failed=failed)
+
+def bench_get_entries(size: int, concurrency: int) -> dict:
+    latencies = []
+    failed = 0
+
+    def enriched(e: Entry):
+        nonlocal failed
+        latencies.append(time.perf_counter() - fake_ytdlp.listed_at[e.id])
+        if not e.visited:
+            failed += 1
+
+    fake_ytdlp.listed_at.clear()
+    start = time.perf_counter()
+    entries = shenanigans.get_entries(fake_ytdlp.playlist_url(size), max_concurrency=concurrency, on_entry=enriched)
+    return common.summary("get-entries", size, time.perf_counter() - start, latencies,
+                          failed=failed, listed=len(entries))
+
+def bench_download(size: int, concurrency: int, backend: str) -> dict:
+    entries = [Entry(id=i, title=f"Track {i}") for i in replay.video_ids("BENCH", size)]
+    submitted: dict[str, float] = {}
+    latencies = []
+
+    def downloaded(item: Entry, file: str):
+        latencies.append(time.perf_counter() - submitted[item.id])
+
+    with tempfile.TemporaryDirectory(prefix="mist-bench-") as destination:
+        start = time.perf_counter()
+        with shenanigans.DownloadPool(Source.YOUTUBE, destination, max_concurrency=concurrency, backend=backend,
+                                      on_downloaded=downloaded) as pool:
+            for e in entries:
+                # time in the pool, submit itself blocks while it is saturated
+                pool.submit(e)
+                submitted[e.id] = time.perf_counter()
+            pool.wait()
+        seconds = time.perf_counter() - start
+        failed = len(pool.failed)
+
+    return common.summary("download", size, seconds, latencies, failed=failed)
+
+def main():
+    parser = argparse.ArgumentParser(description="connector benchmarks against an offline replay server")
+    parser.add_argument("--sizes", type=common.parse_sizes, default=common.DEFAULT_SIZES)
+    parser.add_argument("--cases", type=lambda v: v.split(","), default=CASES)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=10.0) # ms
+    parser.add_argument("--jitter", type=float, default=0.0) # ms
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500) # 429 or 503 go through the retries
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--media-size", type=int, default=256) # KiB
+    parser.add_argument("--backend", choices=sorted(shenanigans.DOWNLOAD_BACKENDS), default="thread")
+    parser.add_argument("--keep-ratelimits", action="store_true") # measures the limiter instead of the pipeline
+    parser.add_argument("--fixtures", default=replay.FIXTURES_DIR)
+    parser.add_argument("--json", metavar="<file>") # - for stdout
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases {', '.join(sorted(unknown))}")
+
+    if not args.verbose:
+        # injected errors would flood the output
+        for name in list(logging.root.manager.loggerDict):
+            if name.startswith("mist"):
+                logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    faults = replay.Faults(latency=args.latency / 1000, jitter=args.jitter / 1000,
+                           error_rate=args.error_rate, error_status=args.error_status)
+    results = []
+    with replay.ReplayServer(replay.Fixtures(args.fixtures, media_size=args.media_size * 1024), faults) as server:
+        net.set_host_override(server.url)
+        fake_ytdlp.install(server)
+        configure(args.concurrency, args.keep_ratelimits, args.retries)
+
+        for size in args.sizes:
+            for case in args.cases:
+                reset()
+                requests_before = server.requests
+                match case:
+                    case "obtain-youtube":
+                        result = bench_obtain(Source.YOUTUBE, size, args.concurrency)
+                    case "obtain-soundcloud":
+                        result = bench_obtain(Source.SOUNDCLOUD, size, args.concurrency)
+                    case "obtain-bandcamp":
+                        result = bench_obtain(Source.BANDCAMP, size, args.concurrency)
+                    case "get-entries":
+                        result = bench_get_entries(size, args.concurrency)
+                    case "download":
+                        result = bench_download(size, args.concurrency, args.backend)
+                result["requests"] = server.requests - requests_before
+                results.append(result)
+                if not args.json:
+                    print(f"{case} {size}: {result['seconds']}s", flush=True)
+
+        net.set_host_override(None)
+
+    if args.json:
+        common.write_json(args.json, results, **vars(args))
+    if args.json != "-":
+        common.print_table(results)
+
+if __name__ == "__main__":
+    main()
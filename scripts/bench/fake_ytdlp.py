@@ -0,0 +1,91 @@
+"""
+yt-dlp extractors answering from the replay server instead of youtube
+
+playlists are https://www.youtube.com/playlist?list=BENCH<count>, their pages come from the replay server
+so listing pays the same latency as everything else, videos resolve to a single audio format served by it too
+"""
+
+import itertools
+import os
+import time
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+
+import replay
+
+# entry id to when the listing handed it out, for latencies of the whole pipeline
+listed_at: dict[str, float] = {}
+
+# download workers are spawned, they find the server through the environment
+_ENV_URL = "MIST_BENCH_REPLAY_URL"
+
+_url: str | None = None
+
+class BenchPlaylistIE(InfoExtractor):
+    _VALID_URL = r"https?://(?:www\.|music\.)?youtube\.com/playlist\?list=(?P<id>BENCH(?P<count>\d+))"
+    IE_NAME = "bench:playlist"
+
+    def _real_extract(self, url):
+        m = self._match_valid_url(url)
+        playlist, count = m.group("id"), int(m.group("count"))
+
+        def entries():
+            for page in itertools.count():
+                data = self._download_json(f"{_url}/www.youtube.com/bench/playlist", playlist,
+                                           query={"list": playlist, "count": count, "page": page},
+                                           note=False)
+                for e in data["entries"]:
+                    listed_at[e["id"]] = time.perf_counter()
+                    yield self.url_result(f"https://www.youtube.com/watch?v={e['id']}", BenchVideoIE, e["id"], e["title"])
+                if not data["more"]:
+                    break
+
+        return self.playlist_result(entries(), playlist, f"Bench {count}")
+
+class BenchVideoIE(InfoExtractor):
+    _VALID_URL = r"https?://(?:www\.|music\.)?youtube\.com/watch\?v=(?P<id>[\w-]+)"
+    IE_NAME = "bench:video"
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return {
+            "id": video_id,
+            "title": f"Track {video_id}",
+            "formats": [{
+                "format_id": "audio",
+                "url": f"{_url}/media/{video_id}.mp3",
+                "ext": "mp3",
+                "acodec": "mp3",
+                "vcodec": "none",
+            }],
+        }
+
+_EXTRACTORS = (BenchPlaylistIE, BenchVideoIE)
+
+class BenchYoutubeDL(yt_dlp.YoutubeDL):
+    """the bench extractors go first, so they win over the real youtube ones"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        instances = {ie.ie_key(): ie(self) for ie in _EXTRACTORS}
+        self._ies = instances | self._ies
+        self._ies_instances.update(instances)
+
+def install(server: replay.ReplayServer):
+    """makes shenanigans use the bench extractors, spawned download workers pick it up on import"""
+    os.environ[_ENV_URL] = server.url
+    _install(server.url)
+
+def _install(url: str):
+    global _url
+    _url = url
+
+    from mist import shenanigans
+    shenanigans.YoutubeDL = BenchYoutubeDL
+
+def playlist_url(count: int) -> str:
+    return f"https://www.youtube.com/playlist?list=BENCH{count}"
+
+if os.environ.get(_ENV_URL):
+    _install(os.environ[_ENV_URL])
@@ -0,0 +1,308 @@
+"""
+offline stand-in for every site the connectors talk to
+
+responses are the templates in fixtures/, trimmed pages shaped like the recorded ones, with the ids filled in
+so any number of distinct tracks can be served, a directory of other captures with the same names can be swapped in
+
+mist gets pointed here by net.set_host_override, requests arrive as /<original host>/<original path>
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from string import Template
+from urllib.parse import urlsplit, parse_qs, quote_plus
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# how many distinct channels the tracks are spread over, channel pages are memoized by the connector
+CHANNELS = 97
+# entries on a single playlist page, yt-dlp pages by 100 as well
+PLAYLIST_PAGE_SIZE = 100
+
+_CHANNEL_PATTERN = re.compile(r"UCbench(\d+)")
+_TRACK_PATTERN = re.compile(r"Track (\S+)")
+
+def _number(value: str, modulo: int) -> int:
+    return int(hashlib.sha1(value.encode("utf-8")).hexdigest()[:12], 16) % modulo
+
+def channel_of(video_id: str) -> str:
+    return f"UCbench{_number(video_id, CHANNELS):04d}"
+
+def video_ids(playlist: str, count: int) -> list[str]:
+    # 11 characters like the real ones
+    return [f"{playlist[:4]}{i:07d}" for i in range(count)]
+
+def _artist_values(channel_id: str) -> dict:
+    artist = f"Artist {channel_id}"
+    return {
+        "channel_id": channel_id,
+        "artist": artist,
+        "lfm_artist": quote_plus(artist),
+        "sc_user": f"artist-{channel_id.lower()}",
+        "user_id": 1000 + int(_CHANNEL_PATTERN.search(channel_id).group(1)),
+    }
+
+def _track_values(video_id: str) -> dict:
+    values = _artist_values(channel_of(video_id))
+    values["video_id"] = video_id
+    values["track"] = f"Track {video_id}"
+    values["lfm_track"] = quote_plus(values["track"])
+    return values
+
+@dataclass
+class Response:
+    status: int
+    body: bytes
+    content_type: str = "text/html; charset=utf-8"
+    headers: dict[str, str] = field(default_factory=dict)
+
+class Fixtures:
+    """turns a request into a response, routes are matched on the original host and path"""
+
+    def __init__(self, directory: str = FIXTURES_DIR, media_size: int = 256 * 1024):
+        self.directory = directory
+        self.media = b"\xff\xfb\x90\x64" + b"\x00" * (media_size - 4)
+        self._templates: dict[str, Template] = {}
+        self.routes = [
+            ("POST", "music.youtube.com", r"/youtubei/v1/player", self.ytm_player),
+            ("GET", "www.youtube.com", r"/watch", self.yt_watch),
+            ("GET", "www.youtube.com", r"/channel/(?P<channel>[^/]+)", self.yt_channel),
+            ("POST", "www.youtube.com", r"/youtubei/v1/browse", self.yt_browse),
+            ("GET", "www.youtube.com", r"/bench/playlist", self.playlist_page),
+            ("GET", "www.last.fm", r"/search/tracks", self.lfm_search),
+            ("GET", "www.last.fm", r"/music/(?P<artist>[^/]+)/_/(?P<track>[^/]+)/\+tags", self.lfm_tags),
+            ("GET", "www.last.fm", r"/music/(?P<artist>[^/]+)/\+tags", self.lfm_tags),
+            ("GET", "www.last.fm", r"/music/(?P<artist>[^/]+)/_/(?P<track>[^/]+)", self.lfm_track),
+            ("GET", "www.last.fm", r"/music/(?P<artist>[^/]+)", self.lfm_artist),
+            ("GET", "soundcloud.com", r"/", self.sc_home),
+            ("GET", "soundcloud.com", r"/(?P<user>[^/]+)", self.sc_user),
+            ("GET", "api-v2.soundcloud.com", r"/search/tracks", self.sc_search),
+            ("GET", "api-v2.soundcloud.com", r"/tracks", self.sc_tracks_bulk),
+            ("GET", "api-v2.soundcloud.com", r"/tracks/(?P<track>\d+)", self.sc_track),
+            ("GET", r"[\w-]+\.bandcamp\.com", r"/track/[^/]+", self.bc_track),
+            ("GET", r"[\w-]+\.bandcamp\.com", r"/", self.bc_artist),
+            ("GET", "media", r"/(?P<name>[^/]+)", self.media_file),
+        ]
+
+    def _render(self, name: str, **values) -> bytes:
+        if name not in self._templates:
+            with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                self._templates[name] = Template(f.read())
+        return self._templates[name].substitute(values).encode("utf-8")
+
+    def _page(self, name: str, **values) -> Response:
+        return Response(200, self._render(name, **values))
+
+    def _json(self, name: str, **values) -> Response:
+        return Response(200, self._render(name, **values), "application/json")
+
+    def handle(self, method: str, host: str, path: str, query: dict, body: bytes) -> Response:
+        for route_method, route_host, route_path, handler in self.routes:
+            if method != route_method or not re.fullmatch(route_host, host):
+                continue
+            if m := re.fullmatch(route_path, path):
+                return handler(query=query, body=body, **m.groupdict())
+        return Response(404, f"no fixture for {method} {host}{path}".encode("utf-8"), "text/plain")
+
+    # region youtube
+
+    def ytm_player(self, body: bytes, **_) -> Response:
+        video_id = json.loads(body)["videoId"]
+        return self._json("ytm_player.json", **_track_values(video_id))
+
+    def yt_watch(self, query: dict, **_) -> Response:
+        return self._page("yt_watch.html", **_track_values(query["v"][0]))
+
+    def yt_channel(self, channel: str, **_) -> Response:
+        return self._page("yt_channel.html", **_artist_values(channel))
+
+    def yt_browse(self, body: bytes, **_) -> Response:
+        channel_id = json.loads(body)["continuation"].removeprefix("about-")
+        return self._json("yt_browse.json", **_artist_values(channel_id))
+
+    def playlist_page(self, query: dict, **_) -> Response:
+        """bare id lists for the fake playlist extractor"""
+        playlist = query["list"][0]
+        count, page = int(query["count"][0]), int(query["page"][0])
+        ids = video_ids(playlist, count)[page * PLAYLIST_PAGE_SIZE:(page + 1) * PLAYLIST_PAGE_SIZE]
+        body = {"entries": [{"id": i, "title": f"Track {i}"} for i in ids],
+                "more": (page + 1) * PLAYLIST_PAGE_SIZE < count}
+        return Response(200, json.dumps(body).encode("utf-8"), "application/json")
+
+    # endregion
+
+    # region last.fm
+
+    def lfm_search(self, query: dict, **_) -> Response:
+        m = _TRACK_PATTERN.search(query["q"][0])
+        if not m:
+            return self._page("lfm_search.html", **_track_values("missing"))
+        return self._page("lfm_search.html", **_track_values(m.group(1)))
+
+    def lfm_track(self, artist: str, track: str, **_) -> Response:
+        return self._page("lfm_track.html", **_track_values(track.removeprefix("Track+")))
+
+    def lfm_tags(self, artist: str, **_) -> Response:
+        return self._page("lfm_tags.html", **_artist_values(_CHANNEL_PATTERN.search(artist).group(0)))
+
+    def lfm_artist(self, artist: str, **_) -> Response:
+        return self._page("lfm_artist.html", **_artist_values(_CHANNEL_PATTERN.search(artist).group(0)))
+
+    # endregion
+
+    # region soundcloud
+
+    def sc_home(self, **_) -> Response:
+        return self._page("sc_home.html", client_id="bench")
+
+    def sc_user(self, user: str, **_) -> Response:
+        m = re.search(r"ucbench(\d+)", user)
+        if not m:
+            return Response(404, b"", "text/plain")
+        return self._page("sc_user.html", **_artist_values(f"UCbench{m.group(1)}"))
+
+    def _sc_track_values(self, track_id: int) -> dict:
+        values = _artist_values(f"UCbench{track_id % CHANNELS:04d}")
+        values["track_id"] = track_id
+        return values
+
+    def sc_search(self, query: dict, **_) -> Response:
+        q = query["q"][0]
+        limit = int(query.get("limit", ["0"])[0])
+        m = _CHANNEL_PATTERN.search(q)
+        collection = []
+        if limit and m:
+            channel = int(m.group(1))
+            # found track belongs to the searched artist
+            track_id = _number(q, 10 ** 6) * CHANNELS + channel
+            collection.append({"id": track_id, "title": q, "user": {"id": 1000 + channel}})
+        body = {"total_results": 1 if m else 0, "collection": collection}
+        return Response(200, json.dumps(body).encode("utf-8"), "application/json")
+
+    def sc_track(self, track: str, **_) -> Response:
+        return self._json("sc_track.json", **self._sc_track_values(int(track)))
+
+    def sc_tracks_bulk(self, query: dict, **_) -> Response:
+        ids = [int(i) for i in query["ids"][0].split(",") if i]
+        body = b"[" + b",".join(self._render("sc_track.json", **self._sc_track_values(i)) for i in ids) + b"]"
+        return Response(200, body, "application/json")
+
+    # endregion
+
+    # region bandcamp
+
+    def bc_track(self, **_) -> Response:
+        return self._page("bc_track.html", band="bench")
+
+    def bc_artist(self, **_) -> Response:
+        return self._page("bc_artist.html", band="bench")
+
+    # endregion
+
+    def media_file(self, name: str, **_) -> Response:
+        return Response(200, self.media, "audio/mpeg")
+
+@dataclass
+class Faults:
+    """latency in seconds for every response, error_rate of them get error_status instead"""
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    seed: int = 0
+
+class ReplayServer:
+    """threaded http server on localhost, keeps connections alive like the real sites"""
+
+    def __init__(self, fixtures: Fixtures = None, faults: Faults = None, port: int = 0):
+        self.fixtures = fixtures or Fixtures()
+        self.faults = faults or Faults()
+        self.requests = 0
+        self.injected = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(self.faults.seed)
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server._serve(self)
+
+            def do_POST(self):
+                server._serve(self)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="bench-replay", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def media_url(self, name: str) -> str:
+        return f"{self.url}/media/{name}"
+
+    def _fault(self) -> tuple[float, bool]:
+        with self._lock:
+            self.requests += 1
+            delay = self.faults.latency + self._random.uniform(0, self.faults.jitter) if self.faults.jitter else self.faults.latency
+            failed = self.faults.error_rate > 0 and self._random.random() < self.faults.error_rate
+            if failed:
+                self.injected += 1
+        return delay, failed
+
+    def _serve(self, handler: BaseHTTPRequestHandler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        parts = urlsplit(handler.path)
+        host, _, path = parts.path.lstrip("/").partition("/")
+        query = parse_qs(parts.query)
+
+        delay, failed = self._fault()
+        if delay:
+            time.sleep(delay)
+
+        if failed:
+            # throttling ones are retried right away, the backoff is not what gets measured
+            response = Response(self.faults.error_status, b"injected", "text/plain", {"Retry-After": "0"})
+        else:
+            try:
+                response = self.fixtures.handle(handler.command, host, "/" + path, query, body)
+            except Exception as e:
+                response = Response(500, f"{type(e).__name__}: {e}".encode("utf-8"), "text/plain")
+
+        handler.send_response(response.status)
+        handler.send_header("Content-Type", response.content_type)
+        handler.send_header("Content-Length", str(len(response.body)))
+        for k, v in response.headers.items():
+            handler.send_header(k, v)
+        handler.end_headers()
+        handler.wfile.write(response.body)
+
+    def start(self) -> "ReplayServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
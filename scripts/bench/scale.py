@@ -0,0 +1,166 @@
+"""
+time and peak memory of the local paths at playlist scale, nothing touches the network
+
+    python scripts/bench/scale.py --sizes 10k,100k --json results.json
+
+cases:
+- ini-save, ini-load: local_save and local_load
+- store-save-*, store-load-*, store-put-*: every entries backend, put writes 1% of the entries
+- merge-fast, merge-tags: the merge loop of fetch against a refetch with 1% changed and 1% new entries
+- worktree-load: worktree_load over a directory of that many files
+- index-refresh-cold, index-refresh-warm, index-load, index-save: the worktree index
+- config-load, config-save, config-keys, config-get: ConfigReader holding that many remotes
+
+seconds are the median of --repeat runs, peak_mib is what tracemalloc saw during one more run
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+from typing import Callable
+
+import common
+import synthetic
+
+from mist import ConfigReader, _merge_entries
+from mist.metadata import local as local_cache, worktree as worktree_cache
+
+DEFAULT_SIZES = [10000, 100000]
+
+# case name to a factory taking the prepared data and giving back (run, setup)
+Case = Callable[["Data"], tuple[Callable[[], object], Callable[[], object] | None]]
+
+class Data:
+    """everything the cases need for one size, generated once"""
+
+    def __init__(self, size: int, directory: str):
+        self.size = size
+        self.directory = directory
+        self.entries = synthetic.playlist(size)
+        self.fetched = synthetic.changed(self.entries)
+        self.put = self.fetched[:max(1, size // 100)]
+
+        self.worktree = os.path.join(directory, "worktree")
+        synthetic.worktree(self.worktree, self.entries)
+
+        self.ini_file = os.path.join(directory, "entries.ini")
+        local_cache.local_save(self.ini_file, self.entries)
+
+        self.index_file = os.path.join(directory, "index")
+        index = worktree_cache.WorktreeIndex(self.index_file)
+        index.refresh(self.worktree)
+        index.save()
+
+        self.config_file = os.path.join(directory, "config")
+        ConfigReader(synthetic.config_settings(size), self.config_file).save()
+
+    def store_dir(self, backend: str) -> str:
+        return os.path.join(self.directory, f"store-{backend}")
+
+    def fresh_store(self, backend: str) -> local_cache.EntriesStore:
+        return local_cache.BACKENDS[backend](self.store_dir(backend))
+
+    def reset_store(self, backend: str):
+        directory = self.store_dir(backend)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+    def saved_store(self, backend: str):
+        self.reset_store(backend)
+        _settle(self.fresh_store(backend), lambda s: s.save(self.entries))
+
+def _settle(store: local_cache.EntriesStore, action: Callable[[local_cache.EntriesStore], object]):
+    """background compaction of the journal counts as well"""
+    action(store)
+    if isinstance(store, local_cache.JournalEntriesStore):
+        store.wait()
+
+def _store_cases(backend: str) -> dict[str, Case]:
+    def save(data: Data):
+        return (lambda: _settle(data.fresh_store(backend), lambda s: s.save(data.entries))), (lambda: data.reset_store(backend))
+
+    def load(data: Data):
+        data.saved_store(backend)
+        return (lambda: data.fresh_store(backend).load()), None
+
+    def put(data: Data):
+        return (lambda: _settle(data.fresh_store(backend), lambda s: s.put(data.put))), (lambda: data.saved_store(backend))
+
+    return {f"store-save-{backend}": save, f"store-load-{backend}": load, f"store-put-{backend}": put}
+
+def _index_cold(data: Data):
+    missing = os.path.join(data.directory, "index-missing")
+    return (lambda: worktree_cache.WorktreeIndex(missing).refresh(data.worktree)), None
+
+def _index_warm(data: Data):
+    return (lambda: worktree_cache.WorktreeIndex(data.index_file).refresh(data.worktree)), None
+
+def _index_save(data: Data):
+    index = worktree_cache.WorktreeIndex(data.index_file)
+    return index.save, None
+
+def _config_get(data: Data):
+    reader = ConfigReader(path=data.config_file)
+    reader.load()
+    names = reader.keys("remote.")
+    return (lambda: [reader.get(f"remote.{n}.url") for n in names]), None
+
+def _config_keys(data: Data):
+    reader = ConfigReader(path=data.config_file)
+    reader.load()
+    return (lambda: reader.keys("remote.")), None
+
+def _config_save(data: Data):
+    reader = ConfigReader(path=data.config_file)
+    reader.load()
+    return reader.save, None
+
+CASES: dict[str, Case] = {
+    "ini-save": lambda d: ((lambda: local_cache.local_save(d.ini_file, d.entries)), None),
+    "ini-load": lambda d: ((lambda: local_cache.local_load(d.ini_file)), None),
+    **{name: case for backend in local_cache.BACKENDS for name, case in _store_cases(backend).items()},
+    "merge-fast": lambda d: ((lambda: _merge_entries(d.entries, d.fetched, is_fast=True, ignore_tags=True)), None),
+    "merge-tags": lambda d: ((lambda: _merge_entries(d.entries, d.fetched)), None),
+    "worktree-load": lambda d: ((lambda: worktree_cache.worktree_load(d.worktree)), None),
+    "index-refresh-cold": _index_cold,
+    "index-refresh-warm": _index_warm,
+    "index-load": lambda d: ((lambda: worktree_cache.WorktreeIndex(d.index_file)), None),
+    "index-save": _index_save,
+    "config-load": lambda d: ((lambda: ConfigReader(path=d.config_file).load()), None),
+    "config-save": _config_save,
+    "config-keys": _config_keys,
+    "config-get": _config_get,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="local cache, merge, worktree and config paths at scale")
+    parser.add_argument("--sizes", type=common.parse_sizes, default=DEFAULT_SIZES)
+    parser.add_argument("--cases", type=lambda v: v.split(","), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", metavar="<file>") # - for stdout
+    args = parser.parse_args()
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases {', '.join(sorted(unknown))}")
+
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix="mist-bench-") as directory:
+            data = Data(size, directory)
+            for name in args.cases:
+                run, setup = CASES[name](data)
+                seconds, peak = common.measure(run, setup, repeat=args.repeat)
+                result = common.summary(name, size, seconds, peak_mib=round(peak / 1024 / 1024, 2))
+                results.append(result)
+                if not args.json:
+                    print(f"{name} {size}: {result['seconds']}s", flush=True)
+
+    if args.json:
+        common.write_json(args.json, results, **vars(args))
+    if args.json != "-":
+        common.print_table(results)
+
+if __name__ == "__main__":
+    main()
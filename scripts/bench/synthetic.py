@@ -0,0 +1,66 @@
+"""synthetic playlists, worktrees and configs of any size, same seed gives the same data"""
+
+import os
+import random
+
+from mist import Entry
+
+_GENRES = ["Electronic", "Hip-Hop", "Rock", "Jazz", "Ambient", "Pop", None]
+_TAGS = ["electronic", "chill", "deep house", "lofi", "80s", "vaporwave", "live", "remix", "instrumental", "cover"]
+_ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+def _video_id(rng: random.Random) -> str:
+    return "".join(rng.choice(_ID_ALPHABET) for _ in range(11))
+
+def playlist(size: int, seed: int = 0) -> list[Entry]:
+    """entries like a fetch with tags leaves them, ids are unique"""
+    rng = random.Random(seed)
+    ids = set()
+    output = []
+    while len(output) < size:
+        entry_id = _video_id(rng)
+        if entry_id in ids:
+            continue
+        ids.add(entry_id)
+
+        artist = f"Artist {rng.randrange(size // 20 + 1)}"
+        output.append(Entry(id=entry_id,
+                            title=f"{artist} - Track {len(output)}",
+                            url=f"https://www.youtube.com/watch?v={entry_id}",
+                            name=f"Track {len(output)}",
+                            tags=rng.sample(_TAGS, rng.randrange(4)),
+                            artist=f"UC{_video_id(rng)}",
+                            artist_name=artist,
+                            genre=rng.choice(_GENRES)))
+    return output
+
+def changed(entries: list[Entry], ratio: float = 0.01, seed: int = 1) -> list[Entry]:
+    """refetched playlist, ratio of the entries got a new title and a tag, as many new ones showed up on top"""
+    rng = random.Random(seed)
+    count = max(1, int(len(entries) * ratio))
+    updated = set(rng.sample(range(len(entries)), count))
+
+    output = playlist(count, seed=seed + 1000)
+    for i, e in enumerate(entries):
+        e = Entry(**vars(e))
+        e.tags = list(e.tags or [])
+        if i in updated:
+            e.title += " (Remastered)"
+            e.tags.append("remastered")
+        output.append(e)
+    return output
+
+def worktree(directory: str, entries: list[Entry], ext: str = "mp3"):
+    """empty files named the way downloads are"""
+    os.makedirs(directory, exist_ok=True)
+    for e in entries:
+        with open(os.path.join(directory, f"{e.title}.{e.id}.{ext}"), "wb"):
+            pass
+
+def config_settings(size: int) -> dict[str, str]:
+    """a config with size remotes, like a repository collecting lots of playlists"""
+    settings = {"core.concurrency": "8", "core.entriesBackend": "sqlite"}
+    for i in range(size):
+        settings[f"remote.remote{i}.url"] = f"https://www.youtube.com/playlist?list=PL{i:032d}"
+        settings[f"remote.remote{i}.skipFetchAll"] = "false"
+    return settings
@@ -1,8 +1,13 @@
 # mist - another stupid content tracker
 
+import concurrent.futures
+import contextlib
+import copy
 import os
+import threading
 import warnings
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
 from pprint import pprint
 
 _package_name = __package__
@@ -28,9 +33,11 @@ from .errors import MistError
 from . import log
 from . import config
 from .messages import *
-from . import shenanigans, metadata
-from .utils import url_strip_utm, url_strip_share_identifier, sanitize_filename
-from .metadata import local as local_cache, worktree as worktree_cache
+from . import shenanigans, metadata, transcode, retry
+from .utils import url_strip_utm, url_strip_share_identifier, sanitize_filename, user_cache_dir
+from .metadata import local as local_cache, worktree as worktree_cache, net
+
+DEFAULT_INCREMENTAL_STOP_AFTER = 5
 
 def _find_repository_dir(start: str, soft: bool = True) -> str | None:
     assert os.path.isabs(start)
@@ -47,6 +54,46 @@ def _find_repository_dir(start: str, soft: bool = True) -> str | None:
 
     raise MistError(MSG_NOT_A_REPOSITORY)
 
+def find_repositories(root: str) -> list[str]:
+    """working dirs of the repositories under root, repositories are not looked into"""
+    found = []
+    pending = [os.path.abspath(root)]
+    while pending:
+        directory = pending.pop()
+        if os.path.isdir(os.path.join(directory, files.DIR_REPOSITORY)):
+            found.append(directory)
+            continue
+        try:
+            with os.scandir(directory) as it:
+                pending.extend(d.path for d in it if d.is_dir(follow_symlinks=False) and not d.name.startswith("."))
+        except PermissionError:
+            log.debug(f"can't look into '{directory}'")
+    return sorted(found)
+
+def _run_parallel(items: list, job: Callable, parallel: int, name: str = "job") -> dict:
+    """runs job for every item, errors are returned in place of results"""
+    def run(item):
+        try:
+            return job(item)
+        except Exception as e:
+            log.debug(f"{name} '{item}' failed: {e!r}")
+            return e
+
+    # interrupts only reach the main thread, so a single worker stays on it
+    if parallel == 1:
+        return {i: run(i) for i in items}
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=parallel, thread_name_prefix=f"mist-{name}")
+    try:
+        futures = {i: executor.submit(run, i) for i in items}
+        results = {i: f.result() for i, f in futures.items()}
+    except KeyboardInterrupt:
+        # running ones finish what they have, nothing new gets started
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return results
+
 def _sanitize_url(url: str) -> str:
     url = url_strip_share_identifier(url)
     url = url_strip_utm(url)
@@ -66,23 +113,151 @@ def _merge_entry(original: Entry, new: Entry, prune_tags: bool, ignore_tags: boo
         original.tags = new.tags
 
     if new.visited:
-        if original.visited:
-            original.visited.update(new.visited)
-        else:
-            original.visited = new.visited
+        # no inplace update, original might be shared with the cached snapshot
+        original.visited = (original.visited or set()) | new.visited
 
     return original
 
+def _entry_changed(a: Entry, b: Entry) -> bool:
+    # cache roundtrip turns None into "" and does not keep tag order
+    fields = lambda e: (e.title or None, e.name or None, e.genre or None, e.artist or None, e.artist_name or None)
+    return fields(a) != fields(b) or set(a.tags or []) != set(b.tags or [])
+
+@dataclass
+class EntryDiff:
+    added: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+def _merge_entries(cached: list[Entry], fetched: list[Entry],
+                   force: bool = False,
+                   prune: bool = False,
+                   prune_tags: bool = False,
+                   ignore_tags: bool = False,
+                   is_fast: bool = False,
+                   partial: bool = False) -> tuple[list[Entry], EntryDiff]:
+    """merges fetched entries into cached ones in linear time, output follows the fetched (playlist) order
+
+    partial fetches only cover part of the remote so cached entries missing from them are left alone
+    """
+    index = {e.id: e for e in cached}
+    diff = EntryDiff()
+
+    merged: dict[str, Entry] = {}
+    for new in fetched:
+        if new.id in merged:
+            log.debug(f"duplicate entry '{new.id}'")
+            continue
+
+        existing = index.get(new.id)
+        if existing is None:
+            merged[new.id] = new
+            diff.added.append(new.id)
+            continue
+
+        # forcing uses the whole new item, pruning does not care about the old one
+        if force or prune:
+            result = new
+        else:
+            result = _merge_entry(copy.copy(existing), new, prune_tags=prune_tags, ignore_tags=ignore_tags, is_fast=is_fast)
+        merged[new.id] = result
+
+        if _entry_changed(existing, result):
+            diff.updated.append(new.id)
+        else:
+            diff.unchanged.append(new.id)
+
+    # entries gone from the remote are kept unless pruning
+    for e in cached:
+        if e.id in merged:
+            continue
+        if partial:
+            merged[e.id] = e
+            diff.unchanged.append(e.id)
+            continue
+        diff.removed.append(e.id)
+        if not prune:
+            merged[e.id] = e
+
+    return list(merged.values()), diff
+
 @dataclass
 class Remote:
     name: str = None
     url: str = None
 
+@dataclass
+class FetchResult:
+    entries: list[Entry]
+    diff: EntryDiff
+
+@dataclass
+class RemoteSummary:
+    remote: str
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    downloaded: int = 0
+    failed: int = 0
+    error: str = None
+
+@dataclass
+class RepositorySummary:
+    directory: str
+    remotes: list[RemoteSummary] = field(default_factory=list)
+    error: str = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and all(r.error is None for r in self.remotes)
+
+_CHECKPOINT_BATCH = 64
+
+class _FetchCheckpoint:
+    """merges entries as enrichment finishes them and puts them into the store in batches"""
+
+    def __init__(self, store: local_cache.EntriesStore, cached: list[Entry], **merge_options):
+        self.store = store
+        self.index = {e.id: e for e in cached}
+        self.merge_options = merge_options
+        self.pending: list[Entry] = []
+
+    def add(self, entry: Entry):
+        existing = self.index.get(entry.id)
+        try:
+            merged, _ = _merge_entries([existing] if existing else [], [entry], **self.merge_options)
+        except MistError:
+            # the final merge reports it
+            return
+
+        self.pending.extend(merged)
+        if len(self.pending) >= _CHECKPOINT_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.store.put(self.pending)
+            self.pending = []
+
 class Mist:
-    def __init__(self):
+    def __init__(self, shared: bool = False):
+        """shared ones leave logging and networking to whoever drives them, see sync_all"""
+        self.shared = shared
         self.working_dir: str = None
         self.repository_dir: str = None
         self.config: ConfigStack = ConfigStack()
+        self._entries_stores: dict[str, local_cache.EntriesStore] = {}
+        # remotes can be handled in parallel, they share the index and the download queue
+        self._state_lock = threading.RLock()
+        # ids some pull is downloading right now, remotes may share tracks
+        self._downloading: set[str] = set()
+        # tag writer and transcoder while all remotes of pull_many (or repositories of sync_all) go through the same ones
+        self._stage_pools_shared: tuple[worktree_cache.TagWriter, transcode.Transcoder] | None = None
 
     def set_working_dir(self, working_dir):
         assert os.path.isdir(working_dir)
@@ -90,7 +265,7 @@ class Mist:
         self.working_dir = working_dir
         self.config.load()
 
-        log.configure(self.config.active)
+        self._configure()
 
         if found_repository := _find_repository_dir(working_dir):
             log.debug(f"found repository dir '{found_repository}'")
@@ -102,6 +277,7 @@ class Mist:
         assert os.path.isdir(repository_dir)
 
         self.repository_dir = repository_dir
+        self._entries_stores.clear()
         self._assert_repository()
 
         # only set if in repo
@@ -111,7 +287,7 @@ class Mist:
         )
         self.config.load()
 
-        log.configure(self.config.active)
+        self._configure()
 
         from importlib.metadata import version
         if self.config.local.get("core.version") != version(_package_name):
@@ -119,6 +295,17 @@ class Mist:
 
         log.debug(f"repository dir '{self.repository_dir}'")
 
+    def _configure(self):
+        if self.shared:
+            return
+        log.configure(self.config.active)
+        net.configure(self.config.active, self._get_http_cache_dir())
+
+    def _get_http_cache_dir(self) -> str:
+        if self.config.active.get("cache.location", "repository") == "repository" and self.is_repository():
+            return os.path.join(self.repository_dir, files.DIR_REPOSITORY_CACHE)
+        return user_cache_dir()
+
     def is_repository(self):
         return self.repository_dir is not None and os.path.isdir(self.repository_dir) and os.path.basename(self.repository_dir) == files.DIR_REPOSITORY
 
@@ -129,6 +316,7 @@ class Mist:
         target_dir = os.path.join(os.path.abspath(directory), files.DIR_REPOSITORY)
         os.makedirs(target_dir)
         self.repository_dir = target_dir
+        self._entries_stores.clear()
 
         self.config.file_set(repository_dir=self.repository_dir)
 
@@ -139,86 +327,448 @@ class Mist:
 
         return target_dir
 
-    def _get_cache_file(self, remote_name: str, cache_type: str) -> str:
-        result = os.path.join(self.repository_dir, files.DIR_REPOSITORY_CACHE, remote_name, cache_type)
-        os.makedirs(os.path.dirname(result), exist_ok=True)
+    def _get_cache_dir(self, remote_name: str) -> str:
+        result = os.path.join(self.repository_dir, files.DIR_REPOSITORY_CACHE, remote_name)
+        os.makedirs(result, exist_ok=True)
         return result
 
+    def _get_entries_store(self, remote_name: str) -> local_cache.EntriesStore:
+        # kept around, stores may hold on to what they have loaded
+        with self._state_lock:
+            if remote_name not in self._entries_stores:
+                backend = self.config.active.get("core.entriesBackend", local_cache.DEFAULT_BACKEND)
+                self._entries_stores[remote_name] = local_cache.open_store(self._get_cache_dir(remote_name), backend)
+            return self._entries_stores[remote_name]
+
     def fetch(self, remote: str, tags: bool = False,
               dry_run: bool = False,
               force: bool = False,
               prune: bool = False,
               prune_tags: bool = False,
-              progress: Callable[[str], None] = None) -> list[Entry]:
-        """returns a list of locally available entries"""
+              no_cache: bool = False,
+              refresh: bool = False,
+              incremental: bool = False,
+              progress: Callable[[str], None] = None,
+              on_entry: Callable[[Entry], None] = None,
+              concurrency: int = None) -> FetchResult:
+        """returns locally available entries along with what has changed
+
+        incremental fetch stops listing after a run of already known entries and only handles the new ones,
+        it only applies to remotes marked with newestFirst, anything else gets fetched in full,
+        on_entry gets every fetched entry as soon as it is listed (or enriched with tags),
+        concurrency is this fetch's share of core.concurrency when more remotes are fetched at once
+        """
+        self._assert_remote(remote)
+        concurrency = concurrency or self._get_concurrency()
+
+        log.debug(f"fetch {force=}, {prune=}, {prune_tags=}, {no_cache=}, {refresh=}, {incremental=}")
+
+        # only for this fetch, other ones may be running at the same time
+        with net.cache_mode(enabled=not no_cache, refresh=refresh):
+            section_name = self._remote_section_name(remote)
+
+            list_url = self.config.local.get(f"{section_name}.url")
+            loaded = self.get_remote_entries(remote) or []
+
+            merge_options = dict(force=force, prune=prune, prune_tags=prune_tags, ignore_tags=not tags, is_fast=not tags)
+
+            # enriched entries get saved as they come, the diff is still against what was loaded
+            checkpoint = None
+            if tags and not dry_run:
+                checkpoint = _FetchCheckpoint(self._get_entries_store(remote), loaded, **merge_options)
+
+            def entry_ready(e: Entry):
+                if checkpoint:
+                    checkpoint.add(e)
+                if on_entry:
+                    on_entry(e)
+
+            # pruning needs to see the whole remote, nothing to stop at without cached entries,
+            # and new entries have to come first, the listing can't tell which way a playlist is sorted
+            newest_first = self.config.local.getbool(f"{section_name}.newestFirst", False)
+            partial = incremental and newest_first and not prune and bool(loaded)
+            if incremental and not newest_first:
+                log.warning(f"'{remote}' does not list new entries first ({section_name}.newestFirst), fetching all of it")
+            elif incremental and not partial:
+                log.debug("falling back to full fetch")
+
+            listing = shenanigans.iter_entries(list_url, progress=progress)
+            if partial:
+                stop_after = self.config.active.getint("fetch.incrementalStopAfter", DEFAULT_INCREMENTAL_STOP_AFTER)
+                listing = shenanigans.iter_entries_incremental(list_url, {e.id for e in loaded},
+                                                               stop_after=max(1, stop_after),
+                                                               progress=progress)
+
+            if partial and tags:
+                items = shenanigans.enrich_entries(list_url, list(listing),
+                                                   max_concurrency=concurrency,
+                                                   on_entry=entry_ready)
+            elif tags:
+                items = shenanigans.get_entries(list_url,
+                                                progress=progress,
+                                                max_concurrency=concurrency,
+                                                on_entry=entry_ready)
+            else:
+                items = []
+                for e in listing:
+                    items.append(e)
+                    entry_ready(e)
+
+            if partial:
+                log.debug(f"incremental fetch found {len(items)} new entries")
+
+            merged, diff = _merge_entries(loaded, items, partial=partial, **merge_options)
+
+            log.debug(f"fetch diff: {len(diff.added)} added, {len(diff.updated)} updated, {len(diff.removed)} removed, {len(diff.unchanged)} unchanged")
+
+            if not dry_run:
+                self._get_entries_store(remote).save(merged)
+
+            return FetchResult(merged, diff)
+
+    def get_remote_entries(self, remote: str) -> list[Entry] | None:
         self._assert_remote(remote)
 
-        log.debug(f"fetch {force=}, {prune=}, {prune_tags=}")
+        return self._get_entries_store(remote).load()
 
-        section_name = self._remote_section_name(remote)
+    def list_remote(self, remote_url: str) -> Iterator[Entry]:
+        """yields entries as the remote listing pages arrive"""
+        yield from shenanigans.iter_entries(_sanitize_url(remote_url),
+                                            progress=lambda m: log.debug(m))
 
-        list_url = self.config.local.get(f"{section_name}.url")
-        if tags:
-            items = shenanigans.get_entries(list_url,
-                                            progress=progress,
-                                            max_concurrency=self._get_concurrency())
-        else:
-            items = shenanigans.get_entries_fast(list_url,
-                                                 progress=progress)
+    def merge(self, remote: str, progress: Callable = None, retry_failed: bool = False,
+              concurrency: int = None) -> list[Entry]:
+        """retry_failed only goes through the download queue instead of the whole remote"""
+        if progress:
+            raise NotImplementedError("merge progress reporting not implemented")
 
-        loaded = not prune and self.get_remote_entries(remote) or []
+        self._assert_remote(remote)
+        source = metadata.detect_source(self.get_remote(remote).url)
+        queue = self._get_download_queue()
 
-        merged = []
-        if loaded:
-            for existing in loaded:
-                new_for_merging = [i for i in items if i.id == existing.id]
-                if new_for_merging:
-                    new = new_for_merging[0]
-                    items.remove(new)
-                    # forcing uses the whole new item
-                    merged.append(new if force else _merge_entry(existing, new, prune_tags=prune_tags, ignore_tags=not tags, is_fast=not tags))
-                else:
-                    merged.append(existing)
+        if retry_failed:
+            # the queue only knows ids and titles, tags come from the cached entries
+            cached = {e.id: e for e in self.get_remote_entries(remote) or []}
+            entries_to_download = [cached.get(e.id, e) for e in queue.due(remote)]
+        else:
+            entries = self.get_remote_entries(remote)
 
-        merged[:0] = items # prepend existing so they might get overwritten if duplicates occurred
-        loaded = merged
+            missing_ids = {e.id for e in entries} - self._get_worktree_index().ids() - queue.blocked(remote)
 
-        if not dry_run:
-            entries_file = self._get_cache_file(remote, files.CACHE_TYPE_ENTRIES)
-            local_cache.local_save(entries_file, loaded)
+            entries_to_download = [e for e in entries if e.id in missing_ids]
 
-        return loaded
+        if entries_to_download:
+            with self._download_stage(remote, source, queue, max_concurrency=concurrency) as pool:
+                for e in entries_to_download:
+                    pool.submit(e)
+                pool.wait()
+        return entries_to_download
 
-    def get_remote_entries(self, remote: str) -> list[Entry] | None:
+    def pull(self, remote: str, tags: bool = False,
+             no_cache: bool = False,
+             refresh: bool = False,
+             incremental: bool = False,
+             progress: Callable[[str], None] = None,
+             download_progress: Callable[[dict], None] = None,
+             concurrency: int = None) -> list[Entry]:
+        """fetch and merge in one go, entries start downloading while the fetch is still going"""
         self._assert_remote(remote)
 
-        entries_file = self._get_cache_file(remote, files.CACHE_TYPE_ENTRIES)
-        if not os.path.exists(entries_file):
-            return None
-        return local_cache.local_load(entries_file)
-
-    def list_remote(self, remote_url: str) -> list[Entry]:
-        entries = shenanigans.get_entries_fast(_sanitize_url(remote_url),
-                                               progress=lambda m: log.debug(m))
-        return entries
+        source = metadata.detect_source(self.get_remote(remote).url)
+        queue = self._get_download_queue()
+        seen = self._get_worktree_index().ids() | queue.blocked(remote)
+        cached = {e.id: e for e in self.get_remote_entries(remote) or []}
+        downloading = []
+
+        def merged(e: Entry) -> Entry:
+            # files get tagged with what the store ends up with, a plain listing lacks the tags fetched before
+            existing = cached.get(e.id)
+            if existing is None:
+                return e
+            try:
+                return _merge_entries([existing], [e], ignore_tags=not tags, is_fast=not tags)[0][0]
+            except MistError:
+                return existing
+
+        try:
+            with self._download_stage(remote, source, queue, on_progress=download_progress,
+                                      max_concurrency=concurrency) as pool:
+                def discovered(e: Entry):
+                    if e.id in seen:
+                        return
+                    seen.add(e.id)
+                    with self._state_lock:
+                        # another remote got to it first, both would write the same file
+                        if e.id in self._downloading:
+                            return
+                        self._downloading.add(e.id)
+                    e = merged(e)
+                    downloading.append(e)
+                    # blocks the fetch while the pool is saturated
+                    pool.submit(e)
+
+                result = self.fetch(remote, tags=tags,
+                                    no_cache=no_cache,
+                                    refresh=refresh,
+                                    incremental=incremental,
+                                    progress=progress,
+                                    on_entry=discovered,
+                                    concurrency=concurrency)
+
+                # cached ones which never made it to the worktree
+                for e in result.entries:
+                    discovered(e)
+
+                pool.wait()
+        finally:
+            with self._state_lock:
+                self._downloading.difference_update(e.id for e in downloading)
+
+        return downloading
+
+    def fetch_many(self, remotes: list[str], **kwargs) -> dict[str, FetchResult | Exception]:
+        """fetches remotes at once, every remote gets its own result or the error it failed with"""
+        return self._run_remotes(remotes, lambda r, concurrency: self.fetch(r, concurrency=concurrency, **kwargs))
+
+    def pull_many(self, remotes: list[str], **kwargs) -> dict[str, list[Entry] | Exception]:
+        """pulls remotes at once, downloads are split like in fetch_many but all go through one tag writer and transcoder"""
+        with self._stage_pools():
+            return self._run_remotes(remotes, lambda r, concurrency: self.pull(r, concurrency=concurrency, **kwargs))
+
+    def _run_remotes(self, remotes: list[str], job: Callable[[str, int], object]) -> dict[str, object]:
+        """core.concurrency is split between the remotes running at the same time"""
+        for r in remotes:
+            self._assert_remote(r)
+
+        total = self._get_concurrency()
+        parallel = max(1, min(len(remotes), self.config.active.getint("fetch.parallel", total)))
+        share = max(1, total // parallel)
+        log.debug(f"handling {len(remotes)} remotes, {parallel} at once with {share} workers each")
+
+        return _run_parallel(remotes, lambda r: job(r, share), parallel, name="remote")
+
+    def sync_all(self, root: str, merge: bool = True, **fetch_options) -> list[RepositorySummary]:
+        """
+        fetches (and merges) every repository under root within this process
+
+        they share the http sessions, the user response cache, the tag writer and the transcoder,
+        core.concurrency is the budget for all of them and sync.parallel repositories are handled at once
+        """
+        repositories = find_repositories(root)
+        if not repositories:
+            return []
+
+        total = self._get_concurrency()
+        parallel = max(1, min(len(repositories), self.config.active.getint("sync.parallel", total)))
+        share = max(1, total // parallel)
+        log.debug(f"syncing {len(repositories)} repositories, {parallel} at once with {share} workers each")
+
+        # a cache per repository can't be shared
+        net.configure(self.config.active, user_cache_dir())
+
+        with self._stage_pools() as stages:
+            def sync(directory: str) -> RepositorySummary:
+                repository = Mist(shared=True)
+                repository.config.args.settings = dict(self.config.args.settings)
+                repository.set_working_dir(directory)
+                # tagging and converting of all repositories stays within one set of limits
+                repository._stage_pools_shared = stages
+
+                summary = RepositorySummary(directory)
+                for r in repository.get_fetch_all_remotes():
+                    summary.remotes.append(repository._sync_remote(r, share, merge, **fetch_options))
+                return summary
+
+            results = _run_parallel(repositories, sync, parallel, name="repository")
+        return [r if isinstance(r, RepositorySummary) else RepositorySummary(d, error=str(r) or type(r).__name__)
+                for d, r in results.items()]
+
+    def _sync_remote(self, remote: str, concurrency: int, merge: bool, **fetch_options) -> RemoteSummary:
+        summary = RemoteSummary(remote)
+        try:
+            diff = self.fetch(remote, concurrency=concurrency, **fetch_options).diff
+            summary.added, summary.updated, summary.removed = len(diff.added), len(diff.updated), len(diff.removed)
+
+            if merge:
+                attempted = self.merge(remote, concurrency=concurrency)
+                queued = {i.id for i in self._get_download_queue().items.values() if i.remote == remote}
+                summary.failed = sum(1 for e in attempted if e.id in queued)
+                summary.downloaded = len(attempted) - summary.failed
+        except Exception as e:
+            log.debug(f"syncing '{remote}' of '{self.working_dir}' failed: {e!r}")
+            summary.error = str(e) or type(e).__name__
+        return summary
+
+    def get_fetch_all_remotes(self) -> list[str]:
+        """remotes fetched by --all"""
+        return [r.name for r in self.get_remotes()
+                if not self.config.local.getbool(f"{self._remote_section_name(r.name)}.skipFetchAll", False)]
+
+    @contextlib.contextmanager
+    def _download_stage(self, remote: str, source: metadata.Source, queue: retry.DownloadQueue,
+                        on_progress: Callable[[dict], None] = None,
+                        max_concurrency: int = None) -> Iterator[shenanigans.DownloadPool]:
+        """download pool feeding the transcoder and tag writer, whatever did not finish ends up in the download queue"""
+        tag = self.config.active.getbool("tag.write", True)
+        codec = self.config.active.get("transcode.codec")
+        bitrate = self.config.active.get("transcode.bitrate")
+        if codec:
+            transcode.check(codec)
+
+        pool = None
+        # the pools may be shared with other remotes, this stage only keeps track of its own files
+        submitted: list[concurrent.futures.Future] = []
+        # one per downloaded file, done once there is nothing left to do with it
+        finished: list[concurrent.futures.Future] = []
+        written: dict[str, Entry] = {}
+        # downloaded fine but left in the wrong format, those get downloaded and converted again
+        transcode_failed: list[Entry] = []
+        try:
+            with self._stage_pools() as (tagger, transcoder):
+                def tag_file(item: Entry, file: str, done: concurrent.futures.Future):
+                    if not tag:
+                        done.set_result(None)
+                        return
+
+                    def tagged(future):
+                        if not future.cancelled() and future.result():
+                            written[file] = item
+                        done.set_result(None)
+
+                    submitted.append(future := tagger.submit(file, item))
+                    future.add_done_callback(tagged)
+
+                def downloaded(item: Entry, file: str):
+                    finished.append(done := concurrent.futures.Future())
+                    if not codec:
+                        tag_file(item, file, done)
+                        return
+
+                    def transcoded(future):
+                        if future.cancelled():
+                            done.set_result(None)
+                            return
+                        if future.exception() is not None:
+                            log.error(f"failed to transcode '{file}': {future.exception()}")
+                        output = future.result() if future.exception() is None else None
+                        if output is None:
+                            transcode_failed.append(item)
+                            done.set_result(None)
+                        # tagged once it is in its final format
+                        else:
+                            tag_file(item, output, done)
+
+                    submitted.append(future := transcoder.submit(file, codec, bitrate))
+                    future.add_done_callback(transcoded)
+
+                try:
+                    with shenanigans.DownloadPool(source, self.working_dir,
+                                                  max_concurrency=max_concurrency or self._get_concurrency(),
+                                                  backend=self._get_download_backend(),
+                                                  on_progress=on_progress,
+                                                  on_downloaded=downloaded) as pool:
+                        yield pool
+                except BaseException:
+                    # other remotes may still be using the pools, only what this one queued up gets dropped
+                    for f in submitted:
+                        f.cancel()
+                    raise
+                finally:
+                    concurrent.futures.wait(finished)
+        finally:
+            # runs on interrupts as well, nothing of this stage is running by now
+            if pool is not None:
+                with self._state_lock:
+                    # other remotes may have saved the queue in the meantime
+                    queue = self._get_download_queue()
+                    for e in pool.succeeded:
+                        queue.done(remote, e.id)
+                    for e in pool.failed:
+                        queue.fail(remote, e, pool.errors.get(e.id), part=retry.find_part(self.working_dir, e.id))
+                    for e in transcode_failed:
+                        queue.fail(remote, e, "transcoding failed")
+                    for e in pool.unfinished():
+                        if part := retry.find_part(self.working_dir, e.id):
+                            queue.fail(remote, e, "interrupted", part=part, count=False)
+                    queue.save()
+            if written:
+                self._record_tagged(written)
+
+    @contextlib.contextmanager
+    def _stage_pools(self) -> Iterator[tuple[worktree_cache.TagWriter, transcode.Transcoder]]:
+        """tag writer and transcoder, remotes handled at once share them so cpu work stays within its limits"""
+        if self._stage_pools_shared is not None:
+            yield self._stage_pools_shared
+            return
+
+        with self._tag_writer() as tagger, self._transcoder() as transcoder:
+            self._stage_pools_shared = (tagger, transcoder)
+            try:
+                yield self._stage_pools_shared
+            finally:
+                self._stage_pools_shared = None
+
+    def _tag_writer(self) -> worktree_cache.TagWriter:
+        return worktree_cache.TagWriter(max_concurrency=self.config.active.getint("tag.concurrency", os.cpu_count()))
+
+    def _record_tagged(self, written: dict[str, Entry], index: worktree_cache.WorktreeIndex = None):
+        with self._state_lock:
+            index = index or self._get_worktree_index()
+            for file, entry in written.items():
+                index.mark_written(self.working_dir, os.path.relpath(file, self.working_dir), entry)
+            index.save()
+
+    def retag(self, remote: str = None) -> list[str]:
+        """rewrites tags of files whose cached entry changed since they were last tagged"""
+        remotes = [remote] if remote else [r.name for r in self.get_remotes()]
+        entries: dict[str, Entry] = {}
+        for r in remotes:
+            for e in self.get_remote_entries(r) or []:
+                entries.setdefault(e.id, e)
+
+        index = self._get_worktree_index(stat=True)
+        outdated = [(e.path, entries[e.id]) for e in index.entries.values()
+                    if e.id in entries and e.tags_hash != worktree_cache.tags_hash(entries[e.id])]
+        log.debug(f"{len(outdated)} of {len(index.entries)} files need retagging")
+
+        with self._tag_writer() as tagger:
+            for path, e in outdated:
+                tagger.submit(os.path.join(self.working_dir, path), e)
+
+        self._record_tagged(tagger.written, index=index)
+        return sorted(os.path.relpath(f, self.working_dir) for f in tagger.written)
+
+    def _get_worktree_index(self, stat: bool = False) -> worktree_cache.WorktreeIndex:
+        """
+        refreshed index, stat is only needed when file changes matter and not just their presence
+
+        without it only tags of files which can't be identified by their name get read
+        """
+        self._assert_repository()
 
-    def merge(self, remote: str, progress: Callable = None) -> list[Entry]:
-        if progress:
-            raise NotImplementedError("merge progress reporting not implemented")
+        with self._state_lock:
+            index = worktree_cache.WorktreeIndex(os.path.join(self.repository_dir, files.FILE_REPOSITORY_INDEX))
+            changed = index.refresh(self.working_dir, stat=stat)
+            if index.scan_tags(self.working_dir, unidentified_only=not stat):
+                changed = True
+            if changed:
+                index.save()
+        return index
 
-        entries = self.get_remote_entries(remote)
-        source = metadata.detect_source(self.get_remote(remote).url)
+    def ls_files(self) -> list[worktree_cache.IndexEntry]:
+        index = self._get_worktree_index(stat=True)
+        return sorted(index.entries.values(), key=lambda e: e.path)
 
-        worktree_items = worktree_cache.worktree_load(self.working_dir)
-        missing_ids = set([e.id for e in entries]).difference(set([e.id for e in worktree_items]))
+    def get_worktree_entries(self) -> list[Entry]:
+        """local entries as described by the files themselves"""
+        return self._get_worktree_index(stat=True).to_entries()
 
-        entries_to_download = [e for e in entries if e.id in missing_ids]
-        if entries_to_download:
-            shenanigans.download_entries(source, entries_to_download,
-                                         destination_dir=self.working_dir,
-                                         max_concurrency=self._get_concurrency())
-        return entries_to_download
+    def _get_download_queue(self) -> retry.DownloadQueue:
+        self._assert_repository()
 
+        return retry.DownloadQueue(os.path.join(self.repository_dir, files.FILE_REPOSITORY_DOWNLOAD_QUEUE),
+                                   retry_delay=self.config.active.getint("download.retryDelay", retry.DEFAULT_RETRY_DELAY),
+                                   max_attempts=self.config.active.getint("download.maxAttempts", retry.DEFAULT_MAX_ATTEMPTS))
 
     def clone(self, url: str, destination_dir: str = None, origin: str = None, tags: bool = False):
         url = _sanitize_url(url)
@@ -228,8 +778,7 @@ class Mist:
         self.set_working_dir(os.path.abspath(destination_dir))
         remote = origin or self.config.active.get("clone.defaultRemoteName", "origin")
         self.remote_add(remote, url)
-        self.fetch(remote, tags=tags)
-        self.merge(remote)
+        self.pull(remote, tags=tags)
 
     def get_remotes(self) -> list[Remote]:
         self._assert_repository()
@@ -289,6 +838,8 @@ class Mist:
         self.config.local.unset(f"{section_name}.", sub=True)
         self.config.local.save()
 
+        self._entries_stores.pop(name, None)
+
     def remote_rename(self, old_name: str, new_name: str):
         self._assert_remote(old_name)
         # TODO: assert new name
@@ -333,4 +884,11 @@ class Mist:
             f.write(f"{name}\n")
 
     def _get_concurrency(self) -> int:
-        return self.config.local.getint("core.concurrency", os.cpu_count())
\ No newline at end of file
+        return self.config.active.getint("core.concurrency", os.cpu_count())
+
+    def _get_download_backend(self) -> str:
+        return self.config.active.get("core.downloadBackend", "thread")
+
+    def _transcoder(self) -> transcode.Transcoder:
+        """post download stage, cpu concurrency is separate from the network one"""
+        return transcode.Transcoder(max_concurrency=self.config.active.getint("transcode.concurrency", os.cpu_count()))
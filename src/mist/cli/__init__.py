@@ -68,7 +68,7 @@ def build_parser(mist: Mist) -> argparse.ArgumentParser:
     subparsers = parser.add_subparsers(metavar="<command>", dest="command")
 
     from .commands import help as cmd_help
-    from .commands import init, config, remote, fetch, merge, clone, ls_remote, ls_files, pull
+    from .commands import init, config, remote, fetch, merge, clone, ls_remote, ls_files, pull, retag, sync_all
     command_parsers = {
         "help": cmd_help.build_parser(subparsers, mist),
         "config": config.build_parser(subparsers, mist),
@@ -80,6 +80,8 @@ def build_parser(mist: Mist) -> argparse.ArgumentParser:
         "pull": pull.build_parser(subparsers, mist),
         "ls-remote": ls_remote.build_parser(subparsers, mist),
         "ls-files": ls_files.build_parser(subparsers, mist),
+        "retag": retag.build_parser(subparsers, mist),
+        "sync-all": sync_all.build_parser(subparsers, mist),
     }
 
     from importlib.metadata import version
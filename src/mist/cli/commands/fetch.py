@@ -3,10 +3,11 @@ import warnings
 from pprint import pformat
 
 from ..completors import RemoteCompleter
-from ... import Mist
-from .. import log
+from ... import Mist, MistError
+from ...messages import MSG_REMOTES_FAILED
+from .. import log, cli_utils
 
-# TODO: --[no-]all, --negotiate-only, -k --keep, --multiple, -p --prune, -P --prune-tags, -n --no-tags, -t --tags, --[no-]recurse-submodules, -j --jobs, -q --quiet, -v --verbose, --progress, -o --server-option, --[no-]stdin
+# TODO: --negotiate-only, -k --keep, -p --prune, -P --prune-tags, -n --no-tags, -t --tags, --[no-]recurse-submodules, -j --jobs, -q --quiet, -v --verbose, --progress, -o --server-option, --[no-]stdin
 
 _DUMP_ENTRIES = False
 
@@ -17,6 +18,15 @@ def _report_progress(msg):
         return
     print(f"\r{msg}", end="")
 
+def _report_diff(url: str, diff):
+    if not diff.changed:
+        return
+
+    print(f"From {url}")
+    for label, ids in [("new", diff.added), ("updated", diff.updated), ("gone", diff.removed)]:
+        if ids:
+            print(f" * {cli_utils.pad_align(f'{len(ids)} ')}{label}")
+
 def build_parser(subparsers, mist: Mist) -> argparse.ArgumentParser:
     parser = subparsers.add_parser("fetch", description="Download objects from another repository")
     parser.add_argument("remote", metavar="<remote>", nargs='*').completer = RemoteCompleter(mist)
@@ -27,28 +37,50 @@ def build_parser(subparsers, mist: Mist) -> argparse.ArgumentParser:
     parser.add_argument("--force", action="store_true")
     parser.add_argument("--prune", action="store_true")
     parser.add_argument("--prune-tags", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--refresh", action="store_true") # ignore cached responses, store fresh ones
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--all", action=argparse.BooleanOptionalAction, default=False)
 
     def func(args):
         if args.set_upstream:
             assert len(args.remote) == 1
             mist.active_remote_name_set(args.remote[0])
 
-        remotes = args.remote or [mist.active_remote_name_get()]
+        if args.all:
+            assert not args.remote, "fetch --all does not take a remote"
+            remotes = mist.get_fetch_all_remotes()
+        else:
+            remotes = args.remote or [mist.active_remote_name_get()]
         assert remotes
 
         progress = _report_progress if args.progress else None
 
-        for r in remotes:
-            result = mist.fetch(r, tags=args.tags,
-                                progress=progress,
-                                dry_run=args.dry_run,
-                                force=args.force,
-                                prune=args.prune,
-                                prune_tags=args.prune_tags)
+        results = mist.fetch_many(remotes, tags=args.tags,
+                                  progress=progress,
+                                  dry_run=args.dry_run,
+                                  force=args.force,
+                                  prune=args.prune,
+                                  prune_tags=args.prune_tags,
+                                  no_cache=args.no_cache,
+                                  refresh=args.refresh,
+                                  incremental=args.incremental)
+
+        failed = []
+        for r, result in results.items():
+            if isinstance(result, Exception):
+                log.error(f"could not fetch '{r}': {result}")
+                failed.append(r)
+                continue
+
+            _report_diff(mist.remote_get_url(r), result.diff)
 
             if _DUMP_ENTRIES:
-                for e in result:
+                for e in result.entries:
                     log.debug(e)
 
+        if failed:
+            raise MistError(MSG_REMOTES_FAILED.format(action="fetch", count=len(failed), total=len(results)))
+
     parser.set_defaults(func=func, parser=parser)
     return parser
\ No newline at end of file
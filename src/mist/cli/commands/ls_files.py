@@ -1,14 +1,22 @@
 import argparse
 
 from ... import Mist
+from .. import cli_utils
 
+# TODO: -m --modified, -o --others, -d --deleted, -z
 
 def build_parser(subparsers, mist: Mist) -> argparse.ArgumentParser:
-    parser = subparsers.add_parser("ls-files")
+    parser = subparsers.add_parser("ls-files", description="Show information about files in the working tree")
+    parser.add_argument("-s", "--stage", action="store_true") # entry ids along with the files
 
     def func(args):
-        raise NotImplementedError
+        for e in mist.ls_files():
+            if args.stage:
+                entry_id = e.id or "-"
+                print(f"{cli_utils.pad_align(f'{entry_id} ')}{e.path}")
+            else:
+                print(e.path)
 
     parser.set_defaults(func=func, parser=parser)
 
-    return parser
\ No newline at end of file
+    return parser
@@ -8,10 +8,11 @@ from ... import Mist
 def build_parser(subparsers, mist: Mist) -> argparse.ArgumentParser:
     parser = subparsers.add_parser("merge", description="Join objects from two or more repositories")
     parser.add_argument("remote", metavar="<remote>", nargs="?").completer = RemoteCompleter(mist)
+    parser.add_argument("--retry-failed", action="store_true") # only the download queue
 
     def func(args):
         remote = args.remote or mist.active_remote_name_get()
-        if not mist.merge(remote):
+        if not mist.merge(remote, retry_failed=args.retry_failed):
             print("Already up to date.")
 
     parser.set_defaults(func=func, parser=parser)
@@ -1,30 +1,57 @@
 import argparse
 
 from ..completors import RemoteCompleter
-from ... import Mist
+from ... import Mist, MistError, log
+from ...messages import MSG_REMOTES_FAILED
 
-# TODO: -q --quiet, -v --verbose, --progress, --[no-]progress, --[no-]recurse-submodules[=<no-demand>], -n, --[no-]stat,
+# TODO: -q --quiet, -v --verbose, --[no-]progress, --[no-]recurse-submodules[=<no-demand>], -n, --[no-]stat,
+
+def _report_download(status: dict):
+    if status["status"] == "finished":
+        print(f" * {status['id']}")
 
 def build_parser(subparsers, mist: Mist) -> argparse.ArgumentParser:
     parser = subparsers.add_parser("pull")
     parser.add_argument("repository", metavar="<repository>", nargs="?").completer = RemoteCompleter(mist)
     parser.add_argument("--set-upstream", action="store_true")
     parser.add_argument("--tags", action="store_true")
+    parser.add_argument("--progress", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--refresh", action="store_true") # ignore cached responses, store fresh ones
+    parser.add_argument("--incremental", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--full", dest="incremental", action="store_false")
+    parser.add_argument("--all", action="store_true")
 
     def func(args):
         if args.set_upstream:
-            assert len(args.remote) == 1
-            mist.active_remote_name_set(args.remote[0])
+            assert args.repository
+            mist.active_remote_name_set(args.repository)
 
-        remotes = args.repository or [mist.active_remote_name_get()]
-        dirty = False
+        if args.all:
+            assert not args.repository, "pull --all does not take a repository"
+            remotes = mist.get_fetch_all_remotes()
+        else:
+            remotes = [args.repository] if args.repository else [mist.active_remote_name_get()]
+
+        incremental = args.incremental
+        if incremental is None:
+            incremental = mist.config.active.getbool("pull.incremental", False)
 
-        for r in remotes:
-            mist.fetch(r, tags=args.tags)
-        for r in remotes:
-            if mist.merge(r):
+        results = mist.pull_many(remotes, tags=args.tags, no_cache=args.no_cache, refresh=args.refresh,
+                                 incremental=incremental,
+                                 download_progress=_report_download if args.progress else None)
+
+        dirty = False
+        failed = []
+        for r, result in results.items():
+            if isinstance(result, Exception):
+                log.error(f"could not pull '{r}': {result}")
+                failed.append(r)
+            elif result:
                 dirty = True
 
+        if failed:
+            raise MistError(MSG_REMOTES_FAILED.format(action="pull", count=len(failed), total=len(results)))
         if not dirty:
             print("Already up to date.")
 
@@ -0,0 +1,20 @@
+import argparse
+
+from ..completors import RemoteCompleter
+from ... import Mist
+
+# TODO: -n --dry-run, --all
+
+def build_parser(subparsers, mist: Mist) -> argparse.ArgumentParser:
+    parser = subparsers.add_parser("retag", description="Write cached metadata into files which are behind")
+    parser.add_argument("remote", metavar="<remote>", nargs="?").completer = RemoteCompleter(mist)
+
+    def func(args):
+        written = mist.retag(args.remote)
+        for path in written:
+            print(f" * {path}")
+        if not written:
+            print("Already up to date.")
+
+    parser.set_defaults(func=func, parser=parser)
+    return parser
@@ -0,0 +1,50 @@
+import argparse
+import dataclasses
+import json
+import os
+
+from ... import Mist, MistError, log
+from ...messages import MSG_REPOSITORIES_FAILED
+
+def _report(root: str, summary):
+    print(os.path.relpath(summary.directory, root))
+    if summary.error:
+        log.error(f"could not sync '{summary.directory}': {summary.error}")
+    for r in summary.remotes:
+        if r.error:
+            log.error(f"could not sync '{r.remote}': {r.error}")
+            continue
+        counts = [(r.added, "new"), (r.updated, "updated"), (r.removed, "gone"), (r.downloaded, "downloaded"), (r.failed, "failed")]
+        changes = ", ".join(f"{n} {label}" for n, label in counts if n)
+        print(f" * {r.remote}: {changes or 'up to date'}")
+
+def build_parser(subparsers, mist: Mist) -> argparse.ArgumentParser:
+    parser = subparsers.add_parser("sync-all", description="Fetch and merge all repositories under a directory")
+    parser.add_argument("root", metavar="<root>", nargs="?", default=".")
+    parser.add_argument("--tags", action="store_true")
+    parser.add_argument("--no-merge", dest="merge", action="store_false") # fetch only
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--refresh", action="store_true") # ignore cached responses, store fresh ones
+    parser.add_argument("--incremental", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--json", action="store_true")
+
+    def func(args):
+        incremental = args.incremental
+        if incremental is None:
+            incremental = mist.config.active.getbool("pull.incremental", False)
+
+        summaries = mist.sync_all(args.root, merge=args.merge, tags=args.tags,
+                                  no_cache=args.no_cache, refresh=args.refresh, incremental=incremental)
+
+        if args.json:
+            print(json.dumps([dataclasses.asdict(s) for s in summaries], indent=1))
+        else:
+            for s in summaries:
+                _report(args.root, s)
+
+        failed = [s for s in summaries if not s.ok]
+        if failed:
+            raise MistError(MSG_REPOSITORIES_FAILED.format(count=len(failed), total=len(summaries)))
+
+    parser.set_defaults(func=func, parser=parser)
+    return parser
@@ -52,11 +52,12 @@ class ConfigReader:
         return {k.removeprefix(key): v for k, v in self.settings.items() if k.startswith(key)}
 
     def keys(self, key: str):
-        ls = set()
+        # dict keeps the order of appearance
+        ls = {}
         for k in self.settings:
             if k.startswith(key):
                 name = k.removeprefix(key).split(_SEPARATOR, 1)[0]
-                ls.add(name)
+                ls[name] = None
         return list(ls)
 
     def iter(self, key: str):
@@ -150,10 +151,16 @@ class ConfigStack:
         return ConfigReader({}, path, on_commit=lambda _: self.apply())
 
 
+def _create_parser() -> configparser.ConfigParser:
+    parser = configparser.ConfigParser()
+    # keys are camelCase, the default would lowercase them
+    parser.optionxform = str
+    return parser
+
 def _read_ini(path: str) -> dict[str, str]:
     assert os.path.isfile(path)
 
-    parser = configparser.ConfigParser()
+    parser = _create_parser()
     parser.read(path)
     d = {}
     for section in parser.sections():
@@ -169,7 +176,7 @@ def _write_ini(settings: dict[str, str], path: str):
         _convert_to_ini(settings).write(file)
 
 def _convert_to_ini(d: dict[str, str]) -> configparser.ConfigParser:
-    parser = configparser.ConfigParser()
+    parser = _create_parser()
     for k, v in d.items():
         key_parts = k.split(".", 1)
         section = key_parts[0]
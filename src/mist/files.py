@@ -8,5 +8,14 @@ FILE_GLOBAL_CONFIG = ".mistconfig"
 
 FILE_REPOSITORY_CONFIG = "config" # repository config name
 FILE_REPOSITORY_REMOTE = "remote" # current remote name
+FILE_REPOSITORY_DOWNLOAD_QUEUE = "download-queue" # downloads to be retried
+FILE_REPOSITORY_INDEX = "index" # worktree stat data
 
 CACHE_TYPE_ENTRIES = "entries"
+CACHE_TYPE_ENTRIES_DB = "entries.db"
+CACHE_TYPE_ENTRIES_SNAPSHOT = "entries.snapshot"
+CACHE_TYPE_ENTRIES_JOURNAL = "entries.journal"
+CACHE_TYPE_HTTP = "http.db"
+CACHE_TYPE_SOUNDCLOUD_CLIENT_ID = "soundcloud-client-id"
+
+DIR_USER_CACHE = "mist"
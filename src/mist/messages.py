@@ -8,4 +8,9 @@ MSG_NOT_A_REPOSITORY: str = f"not a mist repository (or any of the parent direct
 MSG_NO_SUCH_REMOTE: str = "No such remote '{name}'"
 MSG_NO_REMOTE: str = "No remote"
 MSG_REMOTE_ALREADY_EXISTS: str = "remote {name} already exists."
-MSG_CD_NO_SUCH_DIR: str = "cannot change to '{directory}': No such directory"
\ No newline at end of file
+MSG_CD_NO_SUCH_DIR: str = "cannot change to '{directory}': No such directory"
+MSG_FFMPEG_NOT_FOUND: str = "ffmpeg not found, it is needed for transcoding"
+MSG_UNKNOWN_CODEC: str = "unknown codec '{codec}'"
+MSG_LISTING_FAILED: str = "could not list '{url}': {error}"
+MSG_REMOTES_FAILED: str = "could not {action} {count} of {total} remotes"
+MSG_REPOSITORIES_FAILED: str = "could not sync {count} of {total} repositories"
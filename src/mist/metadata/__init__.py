@@ -1,11 +1,12 @@
+import asyncio
+import concurrent.futures
 import os
 from enum import Enum, auto
 from pprint import pprint, pformat
-from typing import Generic, TypeVar, Callable, Optional, Any
+from typing import Generic, TypeVar, Callable, Optional, Any, Iterable
 from urllib.parse import urlparse, urlsplit
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-import inspect
+from dataclasses import dataclass, field
 
 from .. import Entry
 from ..log import spawn_logger
@@ -65,10 +66,66 @@ def url_source(source: Source, item: str):
 TTrack = TypeVar('TTrack')
 TArtist = TypeVar('TArtist')
 
+@dataclass
+class TrackBundle:
+    """everything enrichment wants from a single connector about a track"""
+    name: str = None
+    title: str = None
+    tags: list[str] = None
+    genre: str = None
+    artist: Any = None
+    artist_name: str = None
+    artist_links: list[str] = None
+
+    # field name to what went wrong
+    errors: dict[str, Exception] = field(default_factory=dict)
+
+    def collect(self, name: str, lmbd: Callable[[], Any]):
+        try:
+            setattr(self, name, lmbd())
+        except NotSupported:
+            pass
+        except Exception as e:
+            self.errors[name] = e
+
+    def fail(self, e: Exception, *names: str):
+        for name in names:
+            self.errors[name] = e
+
 class MetadataConnector(Generic[TTrack, TArtist], ABC):
     # TODO: album/playlist tags
 
     source: Source
+    # how many tracks get_tracks_bulk takes at once, 0 when not supported
+    bulk_size: int = 0
+
+    # region bundle
+
+    def get_track_bundle(self, track: TTrack) -> TrackBundle:
+        """fetch once, extract many; override when fields share an upstream resource"""
+        bundle = TrackBundle()
+        bundle.collect("name", lambda: self.get_track_name(track))
+        bundle.collect("title", lambda: self.get_track_title(track))
+        bundle.collect("tags", lambda: self.get_track_tags(track))
+        bundle.collect("genre", lambda: self.get_track_genre(track))
+        bundle.collect("artist", lambda: self.get_artist(track))
+        if bundle.artist:
+            self.collect_artist(bundle)
+        return bundle
+
+    def collect_artist(self, bundle: TrackBundle):
+        bundle.collect("artist_name", lambda: self.get_artist_name(bundle.artist))
+        bundle.collect("artist_links", lambda: self.get_artist_links(bundle.artist))
+
+    def get_tracks_bulk(self, tracks: list[TTrack]) -> dict[TTrack, TrackBundle]:
+        """bundles for up to bulk_size tracks in as few requests as possible, missing ones get fetched one by one"""
+        raise NotSupported
+
+    async def get_track_bundle_async(self, track: TTrack) -> TrackBundle:
+        """runs the blocking variant on the loop executor, override with a native one if there is any"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_track_bundle, track)
+
+    # endregion
 
     # region track
 
@@ -207,31 +264,23 @@ _build_registry()
 def enrich(data: Data, track: Entry, item,  using_connector: MetadataConnector) -> Data:
     assert using_connector
 
-    clean: bool = True
+    try:
+        bundle = using_connector.get_track_bundle(item)
+    except Exception as e:
+        bundle = TrackBundle()
+        bundle.fail(e, "bundle")
 
-    def try_enrich(lmbd: Callable[[], Any]):
-        nonlocal clean
-        try:
-            return lmbd()
-        except NotSupported:
-            return None
-        except Exception as e:
-            clean = False
-            logger.error(f"connector '{type(using_connector).__name__}' failed during:\n{str(inspect.getsourcelines(lmbd)[0][0]).strip()}\n{type(e).__name__}: {e}")
-            logger.debug(e, exc_info=True)
-            return None
+    return _apply_bundle(data, track, item, using_connector, bundle)
 
-    track_name = try_enrich(lambda: using_connector.get_track_name(item))
-    track_title =  try_enrich(lambda: using_connector.get_track_title(item))
-    track_tags = try_enrich(lambda: using_connector.get_track_tags(item))
-    track_genre = try_enrich(lambda: using_connector.get_track_genre(item))
+def _apply_bundle(data: Data, track: Entry, item, using_connector: MetadataConnector, bundle: TrackBundle) -> Data:
+    for name, e in bundle.errors.items():
+        logger.error(f"connector '{type(using_connector).__name__}' failed during {name}\n{type(e).__name__}: {e}")
+        logger.debug(e, exc_info=e)
+    clean: bool = not bundle.errors
 
-    artist = try_enrich(lambda: using_connector.get_artist(item))
-    artist_name = None
-    artist_links = None
-    if artist:
-        artist_name = try_enrich(lambda: using_connector.get_artist_name(artist))
-        artist_links = try_enrich(lambda: using_connector.get_artist_links(artist))
+    track_title = bundle.title
+    artist = bundle.artist
+    artist_links = bundle.artist_links
 
     match using_connector.source:
         case Source.YOUTUBE:
@@ -244,17 +293,17 @@ def enrich(data: Data, track: Entry, item,  using_connector: MetadataConnector)
             data.lfm_title = track_title
             data.lfm_artist_links = artist_links
 
-    track.name = track.name or track_name
+    track.name = track.name or bundle.name
     track.title = track.title or track_title
-    track.genre = track.genre or track_genre
-    if track_tags:
+    track.genre = track.genre or bundle.genre
+    if bundle.tags:
         if track.tags:
-            track.tags.extend(track_tags)
+            track.tags.extend(bundle.tags)
         else:
-            track.tags = track_tags
+            track.tags = bundle.tags
 
     track.artist = track.artist or artist
-    track.artist_name = track.artist_name or artist_name
+    track.artist_name = track.artist_name or bundle.artist_name
     if artist_links:
         if track.artist_links:
             track.artist_links.extend(artist_links)
@@ -270,32 +319,165 @@ def enrich(data: Data, track: Entry, item,  using_connector: MetadataConnector)
 
     return data
 
-def obtain(source: Source, entry: str):
+def obtain(source: Source, entry: str) -> Entry | None:
+    return obtain_many(source, [entry], max_in_flight=1)[0]
+
+async def _obtain_async(source: Source, entry: str, limit: asyncio.Semaphore, prefetched: TrackBundle = None) -> Entry:
+    """walks the connector graph from source, every blocking call holds a slot of the in-flight limit"""
     logger.debug(f"collecting metadata for '{entry}'")
 
-    visited: set[tuple[Source, str]] = set()
+    loop = asyncio.get_running_loop()
+    # every connector gets visited once, whichever link matched it first wins
+    added: set[Source] = {source}
 
     track = Entry()
     data = Data()
     queue = [(source, entry)]
+    start = (source, entry)
 
     while queue:
         source, item = queue.pop(0)
 
-        if (source, item) in visited:
-            continue
-
         connector = connectors.get_node(source)
         logger.debug(f"visiting {source.name}")
-        data = enrich(data, track, item, connector)
-
-        visited.add((source, item))
+        if prefetched is not None and (source, item) == start:
+            bundle = prefetched
+        else:
+            try:
+                async with limit:
+                    bundle = await connector.get_track_bundle_async(item)
+            except Exception as e:
+                bundle = TrackBundle()
+                bundle.fail(e, "bundle")
+        data = _apply_bundle(data, track, item, connector, bundle)
 
         for link in connectors.get_links(source):
-            if link.to_connector.source and link.to_connector.source not in visited: # don't add added
+            if link.to_connector.source and link.to_connector.source not in added: # don't add added
                 logger.debug(f"matching {link.from_connector.source.name} => {link.to_connector.source.name}")
-                matched = link.matcher(data)
+                async with limit:
+                    matched = await loop.run_in_executor(None, link.matcher, data)
                 if matched:
+                    added.add(link.to_connector.source)
                     queue.append((link.to_connector.source, matched))
 
     return track
+
+async def _prefetch_bulk(connector: MetadataConnector, chunk: list[str], limit: asyncio.Semaphore) -> dict[str, TrackBundle]:
+    try:
+        async with limit:
+            return await asyncio.get_running_loop().run_in_executor(None, connector.get_tracks_bulk, chunk)
+    except NotSupported:
+        return {}
+    except Exception as e:
+        logger.error(f"bulk lookup of {len(chunk)} tracks failed, going one by one\n{type(e).__name__}: {e}")
+        logger.debug(e, exc_info=e)
+        return {}
+
+# entries allowed to wait for enrichment per request in flight, holds the listing back beyond that
+_PIPELINE_DEPTH = 4
+# seconds a partial chunk waits for the listing before going out as it is
+_CHUNK_WAIT = 0.1
+_DONE = object()
+
+async def _obtain_many(source: Source, entries: Iterable[str], max_in_flight: int,
+                       on_result: Callable[[str, Entry | None], None] = None) -> list[Entry | None]:
+    loop = asyncio.get_running_loop()
+    # executor adapter for the blocking connectors, no point in having more threads than slots
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="mist-obtain"))
+
+    limit = asyncio.Semaphore(max_in_flight)
+    connector = connectors.get_node(source)
+    chunk_size = connector.bulk_size or 1
+
+    # entries may be a lazy listing, it gets paged on its own thread into a bounded queue
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_in_flight * _PIPELINE_DEPTH)
+    backlog = asyncio.Semaphore(max_in_flight * _PIPELINE_DEPTH)
+
+    async def produce():
+        iterator = iter(entries)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="mist-listing") as listing:
+                while (entry := await loop.run_in_executor(listing, next, iterator, _DONE)) is not _DONE:
+                    await queue.put(entry)
+        finally:
+            await queue.put(_DONE)
+
+    results: list[Entry | None] = []
+    # on_result may block on a saturated download pool or the disk, the loop keeps going in the meantime
+    callbacks = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="mist-results")
+
+    async def single(index: int, entry: str, prefetched: TrackBundle = None):
+        try:
+            try:
+                result = await _obtain_async(source, entry, limit, prefetched=prefetched)
+            except Exception as e:
+                logger.error(f"failed to collect metadata for '{entry}'\n{type(e).__name__}: {e}")
+                logger.debug(e, exc_info=e)
+                result = None
+
+            results[index] = result
+            if on_result:
+                # holding the backlog slot until then keeps the listing from running away
+                await loop.run_in_executor(callbacks, on_result, entry, result)
+        finally:
+            backlog.release()
+
+    async def chunk_job(chunk: list[tuple[int, str]]):
+        bundles = {}
+        if connector.bulk_size:
+            bundles = await _prefetch_bulk(connector, [e for _, e in chunk], limit)
+        await asyncio.gather(*(single(i, e, bundles.get(e)) for i, e in chunk))
+
+    producer = asyncio.create_task(produce())
+    jobs = set()
+    done = False
+    while not done:
+        # a chunk fills up unless the listing stalls for a moment, single entries would waste the bulk lookup
+        chunk = []
+        deadline = None
+        while len(chunk) < chunk_size and not (chunk and backlog.locked()):
+            await backlog.acquire()
+            try:
+                if deadline is None:
+                    entry = await queue.get()
+                    deadline = loop.time() + _CHUNK_WAIT
+                elif not queue.empty():
+                    entry = queue.get_nowait()
+                else:
+                    entry = await asyncio.wait_for(queue.get(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                backlog.release()
+                break
+            if entry is _DONE:
+                backlog.release()
+                done = True
+                break
+            results.append(None)
+            chunk.append((len(results) - 1, entry))
+
+        if chunk:
+            job = asyncio.create_task(chunk_job(chunk))
+            jobs.add(job)
+            job.add_done_callback(jobs.discard)
+
+    try:
+        await asyncio.gather(*jobs)
+        # listing failures surface here
+        await producer
+    finally:
+        callbacks.shutdown()
+
+    logger.debug(f"obtained {len(results)} tracks")
+    return results
+
+def obtain_many(source: Source, entries: Iterable[str], max_in_flight: int | None = None,
+                on_result: Callable[[str, Entry | None], None] = None) -> list[Entry | None]:
+    """
+    obtain for a bunch of entries at once, results keep the order, failed ones are None
+
+    entries can be a lazy iterable, they get enriched while it is still being consumed
+    """
+    max_in_flight = max_in_flight or os.cpu_count() or 1
+    logger.debug(f"obtaining with {max_in_flight} requests in flight")
+
+    return asyncio.run(_obtain_many(source, entries, max_in_flight, on_result=on_result))
@@ -2,11 +2,9 @@ import functools
 from http.client import responses
 from urllib.parse import urlsplit, urljoin
 
-import requests
-
 from lxml import etree
 
-from . import MetadataConnector, NotSupported, Source
+from . import MetadataConnector, NotSupported, Source, net
 from .scrape_utils import assert_status_code, assert_single
 from .. import Entry
 from ..log import spawn_logger
@@ -28,21 +26,20 @@ t - tracks
 f - fans
 """
 
-search_session = requests.Session()
-
 @functools.cache
 def _ensure_cookies():
     raise NotImplementedError
 
-    search_session.get(URL_GET_SEARCH)
-    search_session.post(URL_GET_SEARCH_QUERY)
-    print(search_session.cookies.items())
+    net.session(URL_HOST).get(URL_GET_SEARCH)
+    net.session(URL_HOST).post(URL_GET_SEARCH_QUERY)
+    print(net.session(URL_HOST).cookies.items())
 
 def _search_wrapper(query, item_type: str) -> list[str]:
     _ensure_cookies()
 
     url = URL_GET_SEARCH.format(query=query, item_type=item_type)
-    response = search_session.get(url)
+    # cookies live in the pooled session
+    response = net.session(URL_HOST).get(url)
     assert_status_code(response)
     print(response.text)
 
@@ -71,7 +68,7 @@ def match_artist(artist_name: str, artist_links):
     return None
 
 def get_artist_tracks(artist_url: str):
-    response = requests.get(artist_url)
+    response = net.get(artist_url)
     assert_status_code(response)
 
     tree = etree.HTML(response.content)
@@ -109,7 +106,7 @@ class BandcampConnector(MetadataConnector[BandcampTrackUrl, BandcampArtistUrl]):
         raise NotSupported
 
     def get_track_tags(self, track: BandcampTrackUrl) -> list[str]:
-        response = requests.get(track)
+        response = net.get(track)
         assert_status_code(response)
 
         tree = etree.HTML(response.content)
@@ -126,7 +123,7 @@ class BandcampConnector(MetadataConnector[BandcampTrackUrl, BandcampArtistUrl]):
         raise NotSupported
 
     def get_artist_links(self, artist: BandcampArtistUrl) -> list[str]:
-        response = requests.get(artist)
+        response = net.get(artist)
         assert_status_code(response)
 
         tree = etree.HTML(response.content)
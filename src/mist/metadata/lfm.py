@@ -3,11 +3,10 @@ from pprint import pprint
 from urllib.parse import urljoin
 
 import microdata
-import requests
 from lxml import etree
 
-from . import MetadataConnector, Source, NotSupported
-from .scrape_utils import assert_status_code, urlappend, assert_single
+from . import MetadataConnector, Source, NotSupported, TrackBundle, net
+from .scrape_utils import assert_status_code, urlappend, assert_single, RateLimitHitError
 from ..log import spawn_logger
 
 class Autism(BaseException):
@@ -35,13 +34,17 @@ def _detect_server_autism(response):
         raise Autism
     assert_status_code(response)
 
+_AUTISM_RETRIES = 3
+
 def retry_on_autism(func):
+    # net already backs off on 600, this only gives the page a few more chances
     def wrapper(*args, **kwargs):
-        while True:
+        for _ in range(_AUTISM_RETRIES):
             try:
                 return func(*args, **kwargs)
             except Autism:
                 logger.debug("autism detected")
+        raise RateLimitHitError
     return wrapper
 
 # get track
@@ -50,7 +53,7 @@ def match_track(yt_ident: str, title: str) -> str | None:
         "q": title,
     }
 
-    response = requests.get(URL_GET_SEARCH_TRACKS, params=search_params)
+    response = net.get(URL_GET_SEARCH_TRACKS, params=search_params)
     assert_status_code(response)
 
     tree = etree.HTML(response.content)
@@ -63,7 +66,7 @@ def match_track(yt_ident: str, title: str) -> str | None:
     return urljoin(URL_HOST, tracks[0])
 
 def _extract_tags_basic(url) -> list[str]:
-    response = requests.get(url)
+    response = net.get(url)
     assert_status_code(response)
 
     tree = etree.HTML(response.content)
@@ -75,7 +78,7 @@ def _extract_tags_basic(url) -> list[str]:
 def _extract_tags(lfm_url) -> list[str]:
     url = urlappend(lfm_url, URL_TAGS_ENDPOINT)
 
-    response = requests.get(url)
+    response = net.get(url)
     _detect_server_autism(response)
 
     tree = etree.HTML(response.content)
@@ -83,6 +86,27 @@ def _extract_tags(lfm_url) -> list[str]:
 
     return tags
 
+def _get_page(url) -> bytes:
+    response = net.get(url)
+    assert_status_code(response)
+    return response.content
+
+# microdata are ass, i really mean it
+def _microdata_of_type(content: bytes, itemtype: str):
+    items = microdata.get_items(content)
+    return [i for i in items if repr(i.itemtype[0]) == itemtype][0]
+
+def _recording(content: bytes):
+    return _microdata_of_type(content, "http://schema.org/MusicRecording")
+
+def _group(content: bytes):
+    return _microdata_of_type(content, "http://schema.org/MusicGroup")
+
+def _artist_page_links(content: bytes) -> list[str]:
+    tree = etree.HTML(content)
+    links = tree.xpath("//h3[text()='External Links']/../ul/li/a/@href")
+    return links
+
 # ezyzee
 
 LastFmTrackUrl = str
@@ -91,20 +115,42 @@ LastFmArtistUrl = str
 class LastFmConnector(MetadataConnector[LastFmTrackUrl, LastFmArtistUrl]):
     source = Source.LASTFM
 
-    def get_track_name(self, track: LastFmTrackUrl) -> str:
-        response = requests.get(track)
-        assert_status_code(response)
+    def get_track_bundle(self, track: LastFmTrackUrl) -> TrackBundle:
+        bundle = TrackBundle()
 
-        items = microdata.get_items(response.content)
-        recording = [i for i in items if repr(i.itemtype[0]) == "http://schema.org/MusicRecording"][0]
-        return recording.name
+        # name, title and artist share the track page
+        try:
+            recording = _recording(_get_page(track))
+        except Exception as e:
+            bundle.fail(e, "name", "title", "artist")
+        else:
+            bundle.collect("name", lambda: recording.name)
+            bundle.collect("title", lambda: f"{recording.byArtist.name} - {recording.name}")
+            bundle.collect("artist", lambda: urljoin(URL_HOST, repr(recording.byArtist.url)))
 
-    def get_track_title(self, track: LastFmTrackUrl) -> str:
-        response = requests.get(track)
-        assert_status_code(response)
+        bundle.collect("tags", lambda: self.get_track_tags(track))
+
+        if bundle.artist:
+            self.collect_artist(bundle)
 
-        items = microdata.get_items(response.content)
-        recording = [i for i in items if repr(i.itemtype[0]) == "http://schema.org/MusicRecording"][0]
+        return bundle
+
+    def collect_artist(self, bundle: TrackBundle):
+        # name and links share the artist page
+        try:
+            page = _get_page(bundle.artist)
+        except Exception as e:
+            bundle.fail(e, "artist_name", "artist_links")
+            return
+
+        bundle.collect("artist_name", lambda: _group(page).name)
+        bundle.collect("artist_links", lambda: _artist_page_links(page))
+
+    def get_track_name(self, track: LastFmTrackUrl) -> str:
+        return _recording(_get_page(track)).name
+
+    def get_track_title(self, track: LastFmTrackUrl) -> str:
+        recording = _recording(_get_page(track))
         return f"{recording.byArtist.name} - {recording.name}"
 
     def get_track_tags(self, track: LastFmTrackUrl) -> list[str]:
@@ -114,30 +160,14 @@ class LastFmConnector(MetadataConnector[LastFmTrackUrl, LastFmArtistUrl]):
         raise NotSupported
 
     def get_artist(self, track: LastFmTrackUrl) -> LastFmArtistUrl:
-        response = requests.get(track)
-        assert_status_code(response)
-
-        items = microdata.get_items(response.content)
-        # microdata are ass, i really mean it
-        recording = [i for i in items if repr(i.itemtype[0]) == "http://schema.org/MusicRecording"][0]
+        recording = _recording(_get_page(track))
         return urljoin(URL_HOST, repr(recording.byArtist.url))
 
     def get_artist_name(self, artist: LastFmArtistUrl) -> str:
-        response = requests.get(artist)
-        assert_status_code(response)
-
-        items = microdata.get_items(response.content)
-        # microdata are ass
-        group = [i for i in items if repr(i.itemtype[0]) == "http://schema.org/MusicGroup"][0]
-        return group.name
+        return _group(_get_page(artist)).name
 
     def get_artist_links(self, artist: LastFmArtistUrl) -> list[str]:
-        response = requests.get(artist)
-        assert_status_code(response)
-
-        tree = etree.HTML(response.content)
-        links = tree.xpath("//h3[text()='External Links']/../ul/li/a/@href")
-        return links
+        return _artist_page_links(_get_page(artist))
 
     def get_artist_tags(self, artist: LastFmArtistUrl) -> list[str]:
         return _extract_tags(artist)
@@ -1,7 +1,12 @@
 import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 
-from .. import ConfigReader, Entry, log
+from .. import ConfigReader, Entry, log, files
+from ..utils import write_atomic
 
 """
 [artist "id"]
@@ -47,4 +52,390 @@ def local_load(file) -> list[Entry]:
         #e.tags = json.loads(reader.get(f"{section_name}.visited", "[]"))
         output.append(e)
     log.debug(f"loaded {len(output)} entries")
-    return output
\ No newline at end of file
+    return output
+
+_MIGRATED_SUFFIX = ".migrated"
+
+class EntriesStore(ABC):
+    """entries cache of a single remote, lives in its cache directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @property
+    @abstractmethod
+    def file(self) -> str:
+        pass
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.file)
+
+    def retire(self):
+        """moves the files out of the way once migrated"""
+        os.replace(self.file, self.file + _MIGRATED_SUFFIX)
+
+    @abstractmethod
+    def load(self) -> list[Entry] | None:
+        pass
+
+    @abstractmethod
+    def save(self, entries: list[Entry]):
+        pass
+
+    def put(self, entries: list[Entry]):
+        """updates some entries in place, unknown ones go to the end and the rest stays untouched"""
+        current = {e.id: e for e in (self.load() or [])}
+        current.update((e.id, e) for e in entries)
+        self.save(list(current.values()))
+
+class IniEntriesStore(EntriesStore):
+    """the original one, whole file gets rewritten every time"""
+
+    @property
+    def file(self) -> str:
+        return os.path.join(self.directory, files.CACHE_TYPE_ENTRIES)
+
+    def load(self) -> list[Entry] | None:
+        if not self.exists():
+            return None
+        return local_load(self.file)
+
+    def save(self, entries: list[Entry]):
+        local_save(self.file, entries)
+
+_SQLITE_SCHEMA_VERSION = 1
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    title TEXT,
+    name TEXT,
+    url TEXT,
+    artist TEXT,
+    artist_name TEXT,
+    genre TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_position ON entries(position);
+CREATE INDEX IF NOT EXISTS entries_title ON entries(title);
+CREATE INDEX IF NOT EXISTS entries_artist ON entries(artist);
+CREATE INDEX IF NOT EXISTS entries_genre ON entries(genre);
+
+CREATE TABLE IF NOT EXISTS tags (
+    entry_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (entry_id, tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+"""
+
+_SQLITE_UPSERT = """
+INSERT INTO entries (id, position, generation, title, name, url, artist, artist_name, genre)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    position = excluded.position,
+    generation = excluded.generation,
+    title = excluded.title,
+    name = excluded.name,
+    url = excluded.url,
+    artist = excluded.artist,
+    artist_name = excluded.artist_name,
+    genre = excluded.genre
+"""
+
+# keeps position and generation of known rows, new ones are appended to the current generation
+_SQLITE_PUT = """
+INSERT INTO entries (id, position, generation, title, name, url, artist, artist_name, genre)
+VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM entries), (SELECT COALESCE(MAX(generation), 1) FROM entries), ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    title = excluded.title,
+    name = excluded.name,
+    url = excluded.url,
+    artist = excluded.artist,
+    artist_name = excluded.artist_name,
+    genre = excluded.genre
+"""
+
+class SqliteEntriesStore(EntriesStore):
+    @property
+    def file(self) -> str:
+        return os.path.join(self.directory, files.CACHE_TYPE_ENTRIES_DB)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.file)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != _SQLITE_SCHEMA_VERSION:
+            assert version == 0, f"unknown entries schema version {version}"
+            connection.executescript(_SQLITE_SCHEMA)
+            connection.execute(f"PRAGMA user_version = {_SQLITE_SCHEMA_VERSION}")
+
+        return connection
+
+    def load(self) -> list[Entry] | None:
+        if not self.exists():
+            return None
+
+        connection = self._connect()
+        try:
+            tags: dict[str, list[str]] = {}
+            for entry_id, tag in connection.execute("SELECT entry_id, tag FROM tags"):
+                tags.setdefault(entry_id, []).append(tag)
+
+            output = []
+            for row in connection.execute("SELECT id, title, name, url, artist, artist_name, genre FROM entries ORDER BY position"):
+                e = Entry(id=row[0], title=row[1], name=row[2], url=row[3], artist=row[4], artist_name=row[5], genre=row[6])
+                e.tags = tags.get(e.id, [])
+                output.append(e)
+        finally:
+            connection.close()
+
+        log.debug(f"loaded {len(output)} entries")
+        return output
+
+    def save(self, entries: list[Entry]):
+        os.makedirs(self.directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            # single transaction, rows not touched by this generation are gone
+            with connection:
+                generation = connection.execute("SELECT COALESCE(MAX(generation), 0) + 1 FROM entries").fetchone()[0]
+
+                rows = []
+                for i, e in enumerate(entries):
+                    assert e.id is not None
+                    rows.append((e.id, i, generation, e.title, e.name, e.url, e.artist, e.artist_name, e.genre))
+                connection.executemany(_SQLITE_UPSERT, rows)
+                connection.execute("DELETE FROM entries WHERE generation != ?", (generation,))
+
+                connection.execute("DELETE FROM tags")
+                connection.executemany("INSERT OR IGNORE INTO tags (entry_id, tag) VALUES (?, ?)",
+                                       ((e.id, t) for e in entries for t in (e.tags or [])))
+        finally:
+            connection.close()
+
+        log.debug(f"saved {len(entries)} entries")
+
+    def put(self, entries: list[Entry]):
+        os.makedirs(self.directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(_SQLITE_PUT, ((e.id, e.title, e.name, e.url, e.artist, e.artist_name, e.genre) for e in entries))
+                connection.executemany("DELETE FROM tags WHERE entry_id = ?", ((e.id,) for e in entries))
+                connection.executemany("INSERT OR IGNORE INTO tags (entry_id, tag) VALUES (?, ?)",
+                                       ((e.id, t) for e in entries for t in (e.tags or [])))
+        finally:
+            connection.close()
+
+        log.debug(f"put {len(entries)} entries")
+
+_JOURNAL_VERSION = 1
+# compaction kicks in once the journal holds this many records and is at least ratio of the snapshot
+_JOURNAL_COMPACT_MIN_RECORDS = 256
+_JOURNAL_COMPACT_RATIO = 0.5
+
+def _entry_to_record(e: Entry) -> dict:
+    return {
+        "id": e.id,
+        "title": e.title,
+        "name": e.name,
+        "url": e.url,
+        "tags": sorted(set(e.tags or [])),
+        "artist": e.artist,
+        "artist_name": e.artist_name,
+        "genre": e.genre,
+    }
+
+def _entry_from_record(record: dict) -> Entry:
+    return Entry(**record)
+
+class JournalEntriesStore(EntriesStore):
+    """
+    snapshot with an append-only journal next to it, only changed records get written
+
+    journal records are idempotent (put, delete, order) so replaying one twice after a crash is harmless
+    """
+
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        # serialized records of the current state in order
+        self._state: dict[str, str] | None = None
+        self._journal_records: int = 0
+        self._compaction: threading.Thread | None = None
+
+    @property
+    def file(self) -> str:
+        return os.path.join(self.directory, files.CACHE_TYPE_ENTRIES_SNAPSHOT)
+
+    @property
+    def journal_file(self) -> str:
+        return os.path.join(self.directory, files.CACHE_TYPE_ENTRIES_JOURNAL)
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.file) or os.path.isfile(self.journal_file)
+
+    def retire(self):
+        self.wait()
+        for file in [self.file, self.journal_file]:
+            if os.path.isfile(file):
+                os.replace(file, file + _MIGRATED_SUFFIX)
+
+    def wait(self):
+        """blocks until background compaction finishes"""
+        if self._compaction:
+            self._compaction.join()
+            self._compaction = None
+
+    def _read_state(self):
+        self.wait()
+
+        state: dict[str, str] = {}
+
+        if os.path.isfile(self.file):
+            with open(self.file, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                assert header.get("version") == _JOURNAL_VERSION, f"unknown snapshot version {header.get('version')}"
+                for line in f:
+                    record = json.loads(line)
+                    state[record["id"]] = line.rstrip("\n")
+
+        self._journal_records = 0
+        if os.path.isfile(self.journal_file):
+            with open(self.journal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn tail of an interrupted append
+                        log.debug("skipping broken journal record")
+                        continue
+                    self._journal_records += 1
+                    match op["op"]:
+                        case "put":
+                            state[op["entry"]["id"]] = json.dumps(op["entry"])
+                        case "del":
+                            state.pop(op["id"], None)
+                        case "order":
+                            state = {i: state[i] for i in op["ids"] if i in state}
+                        case _:
+                            assert False, f"unknown journal operation '{op['op']}'"
+
+        self._state = state
+
+    def load(self) -> list[Entry] | None:
+        if not self.exists():
+            return None
+
+        self._read_state()
+        output = [_entry_from_record(json.loads(r)) for r in self._state.values()]
+
+        log.debug(f"loaded {len(output)} entries")
+        return output
+
+    def save(self, entries: list[Entry]):
+        os.makedirs(self.directory, exist_ok=True)
+
+        if self._state is None:
+            self._read_state()
+        self.wait()
+
+        new_state = {}
+        for e in entries:
+            assert e.id is not None
+            new_state[e.id] = json.dumps(_entry_to_record(e))
+
+        ops = []
+        for k, v in new_state.items():
+            if self._state.get(k) != v:
+                ops.append(json.dumps({"op": "put", "entry": json.loads(v)}))
+        for k in self._state:
+            if k not in new_state:
+                ops.append(json.dumps({"op": "del", "id": k}))
+        # puts append new ids at the end so the order has to be stated whenever it differs
+        if list(new_state) != [k for k in {**self._state, **new_state} if k in new_state]:
+            ops.append(json.dumps({"op": "order", "ids": list(new_state)}))
+
+        self._state = new_state
+        self._append(ops)
+
+        log.debug(f"saved {len(entries)} entries, journaled {len(ops)} records")
+
+    def put(self, entries: list[Entry]):
+        os.makedirs(self.directory, exist_ok=True)
+
+        if self._state is None:
+            self._read_state()
+        self.wait()
+
+        ops = []
+        for e in entries:
+            assert e.id is not None
+            record = json.dumps(_entry_to_record(e))
+            if self._state.get(e.id) != record:
+                # replay appends unknown ids at the end just like the dict does
+                self._state[e.id] = record
+                ops.append(json.dumps({"op": "put", "entry": json.loads(record)}))
+
+        self._append(ops)
+
+        log.debug(f"put {len(entries)} entries, journaled {len(ops)} records")
+
+    def _append(self, ops: list[str]):
+        if ops:
+            with open(self.journal_file, "a", encoding="utf-8") as f:
+                f.writelines(f"{op}\n" for op in ops)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._journal_records += len(ops)
+
+        if self._journal_records >= max(_JOURNAL_COMPACT_MIN_RECORDS, len(self._state) * _JOURNAL_COMPACT_RATIO):
+            # not a daemon, interpreter waits for it on exit
+            self._compaction = threading.Thread(target=self._compact, args=(dict(self._state),), name="mist-compaction")
+            self._compaction.start()
+
+    def _compact(self, state: dict[str, str]):
+        # saving waits for this, no one else touches the files meanwhile
+        log.debug(f"compacting '{self.file}'")
+
+        lines = [json.dumps({"version": _JOURNAL_VERSION}) + "\n"]
+        lines.extend(f"{r}\n" for r in state.values())
+        write_atomic(self.file, lines)
+        # snapshot already holds everything, replaying the old journal would be a no-op
+        write_atomic(self.journal_file, [])
+
+        self._journal_records = 0
+
+BACKENDS: dict[str, type[EntriesStore]] = {
+    "ini": IniEntriesStore,
+    "sqlite": SqliteEntriesStore,
+    "journal": JournalEntriesStore,
+}
+
+DEFAULT_BACKEND = "sqlite"
+
+def open_store(directory: str, backend: str = DEFAULT_BACKEND) -> EntriesStore:
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown entries backend '{backend}'")
+
+    store = BACKENDS[backend](directory)
+
+    # migrate whatever is lying around from a different backend
+    if not store.exists():
+        for name, other_type in BACKENDS.items():
+            if other_type is type(store):
+                continue
+            other = other_type(directory)
+            if other.exists():
+                log.debug(f"migrating entries cache from '{name}' to '{backend}'")
+                store.save(other.load())
+                other.retire()
+                break
+
+    return store
@@ -0,0 +1,441 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Callable
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .. import files
+from ..log import spawn_logger
+from .scrape_utils import RateLimitHitError
+
+logger = spawn_logger(__name__)
+
+# shared http plumbing for connectors, everything should go through here
+
+_DEFAULT_CACHE_MAX_SIZE = 512 # MiB
+_EVICTION_TARGET = 0.9
+_EVICTION_CHECK_EVERY = 64
+
+# seconds
+_DEFAULT_TTL = 24 * 60 * 60
+_DEFAULT_TTLS: dict[str, int] = {
+    "youtube": 24 * 60 * 60,
+    "soundcloud": 24 * 60 * 60,
+    "lastfm": 7 * 24 * 60 * 60,
+    "bandcamp": 7 * 24 * 60 * 60,
+}
+
+# volatile or secret bits which should not make a difference
+_IGNORED_PARAMS = {"client_id"}
+_IGNORED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie"}
+
+def _host_group(url: str) -> str | None:
+    host = urlsplit(url).hostname or ""
+    match host:
+        case h if h == "youtube.com" or h.endswith(".youtube.com"):
+            return "youtube"
+        case h if h == "soundcloud.com" or h.endswith(".soundcloud.com"):
+            return "soundcloud"
+        case h if h == "last.fm" or h.endswith(".last.fm"):
+            return "lastfm"
+        case h if h == "bandcamp.com" or h.endswith(".bandcamp.com"):
+            return "bandcamp"
+    return None
+
+_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed);
+"""
+
+class ResponseCache:
+    """compressed responses in sqlite, least recently used get evicted once over the size limit"""
+
+    def __init__(self, file: str, max_size: int, ttls: dict[str, int], default_ttl: int):
+        self.file = file
+        self.max_size = max_size
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        self._connection = sqlite3.connect(file, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(_CACHE_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def key(method: str, url: str, params: dict | None, body) -> str:
+        params = {k: v for k, v in (params or {}).items() if k not in _IGNORED_PARAMS}
+        raw = json.dumps([method.upper(), url, sorted(params.items()), body], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def ttl(self, url: str) -> int:
+        return self.ttls.get(_host_group(url), self.default_ttl)
+
+    def get(self, key: str, url: str) -> requests.Response | None:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT status, headers, body, stored FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[3] + self.ttl(url) < now:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+
+        response = requests.Response()
+        response.status_code = row[0]
+        response.headers = CaseInsensitiveDict(json.loads(row[1]))
+        response._content = zlib.decompress(row[2])
+        response.url = url
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def put(self, key: str, response: requests.Response):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _IGNORED_HEADERS}
+        body = zlib.compress(response.content)
+        now = time.time()
+
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO responses (key, url, status, headers, body, size, stored, accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (key, response.url, response.status_code, json.dumps(headers), body, len(body), now, now))
+            self._connection.commit()
+
+            self._writes += 1
+            if self._writes % _EVICTION_CHECK_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        target = total - self.max_size * _EVICTION_TARGET
+        freed = 0
+        victims = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if freed >= target:
+                break
+            victims.append((key,))
+            freed += size
+
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._connection.commit()
+        logger.debug(f"evicted {len(victims)} cached responses ({freed} bytes)")
+
+# requests per second, burst defaults to the rate
+_DEFAULT_RATE = 8.0
+_DEFAULT_RATES: dict[str, float] = {
+    "youtube.com": 10.0,
+    "music.youtube.com": 10.0,
+    "api-v2.soundcloud.com": 5.0,
+    "soundcloud.com": 2.0,
+    "last.fm": 4.0,
+    "bandcamp.com": 4.0,
+}
+_DEFAULT_RETRIES = 5
+_BACKOFF_BASE = 1.0 # seconds, doubled on each retry
+_BACKOFF_MAX = 60.0
+# multiplicative decrease, additive increase
+_SLOWDOWN_FACTOR = 0.5
+_RECOVERY_STEP = 0.02
+_MIN_RATE_FRACTION = 0.05
+
+# 600 is last.fm being last.fm
+_THROTTLE_STATUS_CODES = {429, 503, 600}
+
+def _limiter_key(url: str) -> str:
+    host = (urlsplit(url).hostname or "").removeprefix("www.")
+    if host.endswith(".bandcamp.com"):
+        return "bandcamp.com"
+    return host
+
+class TokenBucket:
+    """slows down by half on throttling signals, crawls back up to the configured rate on success"""
+
+    def __init__(self, rate: float, burst: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        if self.max_rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self._lock:
+            self.rate = max(self.max_rate * _MIN_RATE_FRACTION, self.rate * _SLOWDOWN_FACTOR)
+            # drain so the next ones wait for the slower refill
+            self.tokens = min(self.tokens, 0)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * _RECOVERY_STEP)
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+_rates: dict[str, float] = dict(_DEFAULT_RATES)
+_bursts: dict[str, float] = {}
+_default_rate: float = _DEFAULT_RATE
+_retries: int = _DEFAULT_RETRIES
+
+def _bucket(url: str) -> TokenBucket:
+    key = _limiter_key(url)
+    with _buckets_lock:
+        if key not in _buckets:
+            rate = _rates.get(key, _default_rate)
+            _buckets[key] = TokenBucket(rate, _bursts.get(key, max(rate, 1)))
+        return _buckets[key]
+
+def slow_down(url: str):
+    """for throttling signals only a connector can spot, like youtube leaving out data"""
+    logger.debug(f"slowing down on '{_limiter_key(url)}'")
+    _bucket(url).slow_down()
+
+def _backoff(attempt: int, response: requests.Response | None) -> float:
+    if response is not None and (retry_after := response.headers.get("Retry-After", "")).isdigit():
+        return min(_BACKOFF_MAX, float(retry_after))
+    return min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt)
+
+def _is_reset(e: BaseException) -> bool:
+    """remote hanging up mid request, as opposed to not being reachable at all"""
+    seen = set()
+    pending = [e]
+    while pending:
+        e = pending.pop()
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        if isinstance(e, (ConnectionResetError, urllib3.exceptions.ProtocolError)):
+            return True
+        # requests and urllib3 wrap the actual error in args or reason
+        pending.extend(a for a in e.args if isinstance(a, BaseException))
+        pending.extend((getattr(e, "reason", None), e.__cause__, e.__context__))
+    return False
+
+_cache: ResponseCache | None = None
+# what the cache gets opened with once a request can use it, None while disabled
+_cache_args: tuple | None = None
+_cache_lock = threading.Lock()
+_cache_read: bool = True
+_cache_dir: str | None = None
+# (enabled, refresh) of every running cache_mode, fetches running at once may each have their own
+_cache_overrides: list[tuple[bool, bool]] = []
+
+# one keep-alive session per host, sized so every worker gets its own connection
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_pool_size: int = os.cpu_count() or 1
+
+def session(url: str) -> requests.Session:
+    """pooled session for the host of url, sessions are shared between threads"""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        if host not in _sessions:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_pool_size)
+            s = requests.Session()
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _sessions[host] = s
+            logger.debug(f"new session for '{host}' ({_pool_size} connections)")
+        return _sessions[host]
+
+# everything goes to a single server instead, the original host becomes the first path segment
+_host_override: str | None = None
+
+def set_host_override(base_url: str | None):
+    """sends requests to base_url/<host>/<path>, for replaying responses offline, None goes back to the real hosts"""
+    global _host_override
+    _host_override = base_url
+    logger.debug(f"host override '{base_url}'")
+
+def _target(url: str) -> str:
+    if _host_override is None:
+        return url
+    parts = urlsplit(url)
+    base = urlsplit(_host_override)
+    return urlunsplit((base.scheme, base.netloc, f"{base.path.rstrip('/')}/{parts.netloc}{parts.path}", parts.query, ""))
+
+def close_sessions():
+    with _sessions_lock:
+        for s in _sessions.values():
+            s.close()
+        _sessions.clear()
+
+def configure(cfg, cache_dir: str | None):
+    """cfg is the active config, cache_dir is where the response cache goes (None disables it)"""
+    global _cache_args, _cache_read, _cache_dir, _pool_size, _default_rate, _retries
+
+    _cache_dir = cache_dir
+
+    pool_size = cfg.getint("core.concurrency", os.cpu_count() or 1)
+    if pool_size != _pool_size:
+        close_sessions()
+        _pool_size = pool_size
+
+    _default_rate = float(cfg.get("ratelimit.rate", _DEFAULT_RATE))
+    _retries = cfg.getint("ratelimit.retries", _DEFAULT_RETRIES)
+    _rates.clear()
+    # an explicit rate goes for every host, only ratelimit.<host>.rate beats it
+    if not cfg.has("ratelimit.rate"):
+        _rates.update(_DEFAULT_RATES)
+    _bursts.clear()
+    # hosts have dots of their own, ratelimit.<host>.<rate|burst>
+    for k, v in cfg.getsub("ratelimit.").items():
+        parts = k.rsplit(".", 1)
+        if len(parts) != 2:
+            continue
+        match parts[1]:
+            case "rate":
+                _rates[parts[0]] = float(v)
+            case "burst":
+                _bursts[parts[0]] = float(v)
+    with _buckets_lock:
+        _buckets.clear()
+
+    _close_cache()
+
+    if cache_dir is None or not cfg.getbool("cache.enabled", True):
+        logger.debug("response cache disabled")
+        return
+
+    ttls = {group: cfg.getint(f"cache.{group}.ttl", ttl) for group, ttl in _DEFAULT_TTLS.items()}
+    max_size = cfg.getint("cache.maxSize", _DEFAULT_CACHE_MAX_SIZE) * 1024 * 1024
+
+    # commands which never request anything should not leave a database behind
+    _cache_args = (os.path.join(cache_dir, files.CACHE_TYPE_HTTP), max_size, ttls, cfg.getint("cache.ttl", _DEFAULT_TTL))
+    _cache_read = not cfg.getbool("cache.refresh", False)
+
+    logger.debug(f"response cache '{_cache_args[0]}'")
+
+def _response_cache() -> ResponseCache | None:
+    global _cache
+    if any(not enabled for enabled, _ in _cache_overrides):
+        return None
+    if _cache is None and _cache_args is not None:
+        with _cache_lock:
+            if _cache is None and _cache_args is not None:
+                _cache = ResponseCache(*_cache_args)
+    return _cache
+
+def _close_cache():
+    global _cache, _cache_args
+    with _cache_lock:
+        if _cache:
+            _cache.close()
+        _cache = None
+        _cache_args = None
+
+def cache_dir() -> str | None:
+    """where connectors can keep their own bits across runs"""
+    return _cache_dir
+
+@contextlib.contextmanager
+def cache_mode(enabled: bool = True, refresh: bool = False):
+    """overrides for the duration of a single run, refreshing still writes fresh responses"""
+    override = (enabled, refresh)
+    with _cache_lock:
+        _cache_overrides.append(override)
+    try:
+        yield
+    finally:
+        with _cache_lock:
+            _cache_overrides.remove(override)
+
+def _reads_cache() -> bool:
+    return _cache_read and not any(refresh for _, refresh in _cache_overrides)
+
+def request(method: str, url: str, params: dict = None, cache: bool = True,
+            validate: Callable[[requests.Response], bool] = None, **kwargs) -> requests.Response:
+    """validate gets the last say on whether a 200 is worth caching, some sites throttle with one"""
+    key = None
+    response_cache = _response_cache() if cache else None
+    if response_cache:
+        key = ResponseCache.key(method, url, params, kwargs.get("json") or kwargs.get("data"))
+        if _reads_cache() and (cached := response_cache.get(key, url)) is not None:
+            if validate is None or validate(cached):
+                logger.debug(f"cache hit {method} {url}")
+                return cached
+            logger.debug(f"cached {method} {url} did not validate")
+
+    bucket = _bucket(url)
+    attempt = 0
+    while True:
+        bucket.acquire()
+        try:
+            # limiter, sessions and the cache still go by the original url
+            response = session(url).request(method, _target(url), params=params, **kwargs)
+        except requests.ConnectionError as e:
+            # remote disconnecting is the usual way of saying no, anything else is not throttling
+            if not _is_reset(e):
+                raise
+            if attempt >= _retries:
+                logger.error(f"getting throttled by '{_limiter_key(url)}'")
+                raise RateLimitHitError from e
+            response = None
+        else:
+            if response.status_code not in _THROTTLE_STATUS_CODES or attempt >= _retries:
+                break
+
+        bucket.slow_down()
+        delay = _backoff(attempt, response)
+        logger.debug(f"throttled by '{_limiter_key(url)}', retrying in {delay:.1f}s")
+        time.sleep(delay)
+        attempt += 1
+
+    if response.status_code not in _THROTTLE_STATUS_CODES:
+        bucket.recover()
+
+    if key and response.status_code == 200 and (validate is None or validate(response)):
+        response_cache.put(key, response)
+
+    return response
+
+def get(url: str, params: dict = None, **kwargs) -> requests.Response:
+    return request("GET", url, params=params, **kwargs)
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
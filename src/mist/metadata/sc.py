@@ -1,17 +1,19 @@
-import functools
 import os
 import shlex
+import threading
+import time
 from pprint import pprint
 import json
 import re
 from typing import Callable
 
-import requests
 from lxml import etree
 
-from . import MetadataConnector, Source, NotSupported
+from . import MetadataConnector, Source, NotSupported, TrackBundle, net
 from .scrape_utils import extract_script_data, json_dict_of_key, assert_status_code, assert_single
+from .. import files
 from ..log import spawn_logger
+from ..utils import write_atomic
 
 # todo: locale
 
@@ -21,6 +23,9 @@ URL_HOST_API2 = "https://api-v2.soundcloud.com"
 URL_HOST_CDN = "https://a-v2.sndcdn.com"
 
 URL_API_GET_TRACKS = URL_HOST_API2 + "/tracks/{track_id}"
+# comma separated, unavailable ones are left out
+URL_API_GET_TRACKS_BULK = URL_HOST_API2 + "/tracks?ids={track_ids}"
+TRACKS_BULK_LIMIT = 50
 # user urn could be used
 URL_API_GET_USERS = URL_HOST_API2 + "/users/{user_id}"
 # user urn must be used
@@ -40,9 +45,15 @@ URL_GET_SEARCH_SETS = URL_HOST + "/search/sets?q={query}"
 
 logger = spawn_logger(__name__)
 
-@functools.cache
-def _prepare_client_id():
-    response = requests.get(URL_HOST)
+# seconds, refreshed sooner when the api stops taking it
+_CLIENT_ID_TTL = 7 * 24 * 60 * 60
+
+_client_id: str | None = None
+_client_id_lock = threading.Lock()
+
+def _scrape_client_id() -> str:
+    # fresh one, a stale page might carry a dead id
+    response = net.get(URL_HOST, cache=False)
     assert_status_code(response)
 
     tree = etree.HTML(response.content)
@@ -51,17 +62,67 @@ def _prepare_client_id():
     client_data = assert_single([i for i in response_data if i["hydratable"] == "apiClient"])["data"]
     return client_data["id"]
 
-def _wrap_request_with_client_id(url):
-    params = {
-        "client_id": _prepare_client_id(),
-    }
+def _client_id_file() -> str | None:
+    directory = net.cache_dir()
+    return directory and os.path.join(directory, files.CACHE_TYPE_SOUNDCLOUD_CLIENT_ID)
+
+def _load_client_id() -> str | None:
+    file = _client_id_file()
+    if not file or not os.path.isfile(file):
+        return None
 
+    try:
+        with open(file, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.debug(f"unusable client id file: {e}")
+        return None
+
+    if data["fetched"] + _CLIENT_ID_TTL < time.time():
+        logger.debug("client id expired")
+        return None
+    return data["id"]
+
+def _store_client_id(client_id: str):
+    file = _client_id_file()
+    if not file:
+        return
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    write_atomic(file, [json.dumps({"id": client_id, "fetched": time.time()})])
+
+def _refresh_client_id() -> str:
+    client_id = _scrape_client_id()
+    _store_client_id(client_id)
+    logger.debug("client id refreshed")
+    return client_id
+
+def _prepare_client_id() -> str:
+    global _client_id
+    if _client_id is None:
+        with _client_id_lock:
+            if _client_id is None:
+                _client_id = _load_client_id() or _refresh_client_id()
+    return _client_id
+
+def _invalidate_client_id(rejected: str):
+    global _client_id
+    with _client_id_lock:
+        # single flight, whoever comes late gets the already refreshed one
+        if _client_id == rejected:
+            _client_id = _refresh_client_id()
+
+def _wrap_request_with_client_id(url):
     # rate limited without this
     headers = {
         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
     }
 
-    response = requests.get(url, params=params, headers=headers)
+    client_id = _prepare_client_id()
+    response = net.get(url, params={"client_id": client_id}, headers=headers)
+    if response.status_code in (401, 403):
+        logger.debug("client id rejected")
+        _invalidate_client_id(client_id)
+        response = net.get(url, params={"client_id": _prepare_client_id()}, headers=headers)
     assert_status_code(response)
 
     return response
@@ -88,7 +149,7 @@ def search_tracks(query: str, limit: int | None = None):
     return _search_wrapper(URL_API_GET_SEARCH_TRACKS, query, limit)
 
 def get_user_id(canonical_id: str):
-    response = requests.get(URL_GET_USER_ID.format(canonical_id=canonical_id))
+    response = net.get(URL_GET_USER_ID.format(canonical_id=canonical_id))
     if response.status_code == 404:
         return None
     assert_status_code(response)
@@ -108,47 +169,81 @@ def match_track_by_artist(title: str, user_url: str):
 
     return candidates[0]["id"] if candidates else None
 
+def _get_track_data(track_id) -> dict:
+    response = _wrap_request_with_client_id(URL_API_GET_TRACKS.format(track_id=track_id))
+    return response.json()
+
+def _get_tracks_data_bulk(track_ids: list) -> dict[str, dict]:
+    assert len(track_ids) <= TRACKS_BULK_LIMIT
+    response = _wrap_request_with_client_id(URL_API_GET_TRACKS_BULK.format(track_ids=",".join(str(i) for i in track_ids)))
+    return {str(t["id"]): t for t in response.json()}
+
+def _track_title(track_data: dict) -> str:
+    label = track_data["title"]
+    author = track_data["user"]["username"]
+    if author not in label:
+        label = f"{author} - {label}"
+    return label
+
+def _track_tags(track_data: dict) -> list[str]:
+    tag_list = track_data["tag_list"]
+    #logger.debug(f"fucky wucky tag_list: '{tag_list}'")
+    tags = None
+
+    if tag_list is None:
+        tags = None
+    elif not tag_list or tag_list.isspace():
+        tags = []
+    elif " " in tag_list:
+        tags = shlex.split(tag_list)
+    else:
+        tags = tag_list.split(",")
+    return tags
+
 SoundCloudTrackId = str
 SoundCloudUserId = str
 
 class SoundCloudConnector(MetadataConnector[SoundCloudTrackId, SoundCloudUserId]):
     source = Source.SOUNDCLOUD
 
+    bulk_size = TRACKS_BULK_LIMIT
+
+    @staticmethod
+    def _bundle(track_data: dict) -> TrackBundle:
+        # everything is in the single track resource
+        bundle = TrackBundle()
+        bundle.collect("name", lambda: track_data["title"])
+        bundle.collect("title", lambda: _track_title(track_data))
+        bundle.collect("tags", lambda: _track_tags(track_data))
+        bundle.collect("genre", lambda: track_data["genre"])
+        bundle.collect("artist_name", lambda: track_data["user"]["username"])
+        return bundle
+
+    def get_track_bundle(self, track: SoundCloudTrackId) -> TrackBundle:
+        try:
+            track_data = _get_track_data(track)
+        except Exception as e:
+            bundle = TrackBundle()
+            bundle.fail(e, "track")
+            return bundle
+
+        return self._bundle(track_data)
+
+    def get_tracks_bulk(self, tracks: list[SoundCloudTrackId]) -> dict[SoundCloudTrackId, TrackBundle]:
+        tracks_data = _get_tracks_data_bulk(tracks)
+        return {str(t): self._bundle(tracks_data[str(t)]) for t in tracks if str(t) in tracks_data}
+
     def get_track_name(self, track: SoundCloudTrackId) -> str:
-        response = _wrap_request_with_client_id(URL_API_GET_TRACKS.format(track_id=track))
-        response_data = response.json()
-        return response_data["title"]
+        return _get_track_data(track)["title"]
 
     def get_track_title(self, track: SoundCloudTrackId) -> str:
-        response = _wrap_request_with_client_id(URL_API_GET_TRACKS.format(track_id=track))
-        response_data = response.json()
-        label = response_data["title"]
-        author = response_data["user"]["username"]
-        if author not in label:
-            label = f"{author} - {label}"
-        return label
+        return _track_title(_get_track_data(track))
 
     def get_track_tags(self, track: SoundCloudTrackId) -> list[str]:
-        response = _wrap_request_with_client_id(URL_API_GET_TRACKS.format(track_id=track))
-        response_data = response.json()
-        tag_list = response_data["tag_list"]
-        #logger.debug(f"fucky wucky tag_list: '{tag_list}'")
-        tags = None
-
-        if tag_list is None:
-            tags = None
-        elif not tag_list or tag_list.isspace():
-            tags = []
-        elif " " in tag_list:
-            tags = shlex.split(tag_list)
-        else:
-            tags = tag_list.split(",")
-        return tags
+        return _track_tags(_get_track_data(track))
 
     def get_track_genre(self, track: SoundCloudTrackId) -> str:
-        response = _wrap_request_with_client_id(URL_API_GET_TRACKS.format(track_id=track))
-        response_data = response.json()
-        return response_data["genre"]
+        return _get_track_data(track)["genre"]
 
     def get_artist(self, track: SoundCloudTrackId) -> SoundCloudUserId:
         raise NotSupported
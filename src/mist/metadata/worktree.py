@@ -1,30 +1,318 @@
+import concurrent.futures
+import hashlib
+import json
 import os
+import struct
+from dataclasses import dataclass
+
+import mutagen
+from mutagen.easyid3 import EasyID3
+from mutagen.easymp4 import EasyMP4Tags
 
 from .. import Entry
 from ..log import spawn_logger
+from ..utils import write_atomic
 
 logger = spawn_logger(__name__)
 
+# downloads in progress, they are not part of the worktree yet
+_PARTIAL_SUFFIX = ".part"
+
+# source id written into the files, for ones which got renamed
+TAG_ID = "mist_id"
+EasyID3.RegisterTXXXKey(TAG_ID, "MIST_ID")
+EasyMP4Tags.RegisterFreeformKey(TAG_ID, "MIST_ID")
+# entry tags, genre only holds one
+TAG_TAGS = "mist_tags"
+EasyID3.RegisterTXXXKey(TAG_TAGS, "MIST_TAGS")
+EasyMP4Tags.RegisterFreeformKey(TAG_TAGS, "MIST_TAGS")
+
+def parse_name(name: str) -> tuple[str, str] | None:
+    """title and id out of 'title.id.ext'"""
+    parts = name.rsplit(".", maxsplit=2)
+    if len(parts) != 3:
+        return None
+    return parts[0], parts[1]
+
+def _is_candidate(name: str) -> bool:
+    return not name.startswith(".") and not name.endswith(_PARTIAL_SUFFIX)
+
+@dataclass
+class FileTags:
+    id: str = None
+    title: str = None
+    artist: str = None
+    genre: str = None
+
+def read_tags(file: str) -> FileTags | None:
+    """embedded tags, None when the file is not audio mutagen understands"""
+    try:
+        audio = mutagen.File(file, easy=True)
+    except mutagen.MutagenError as e:
+        logger.debug(f"can't read tags of '{file}': {e}")
+        return None
+    if audio is None:
+        return None
+    if audio.tags is None:
+        return FileTags()
+
+    def first(key: str) -> str | None:
+        values = audio.tags.get(key)
+        return str(values[0]) if values else None
+
+    # only the id mist wrote itself, renamed files from elsewhere stay unidentified
+    return FileTags(id=first(TAG_ID), title=first("title"), artist=first("artist"), genre=first("genre"))
+
+def _tag_values(entry: Entry) -> dict[str, list[str]]:
+    values = {
+        TAG_ID: [entry.id],
+        "title": [entry.title],
+        "artist": [entry.artist_name],
+        "genre": [entry.genre],
+        TAG_TAGS: sorted(set(entry.tags or [])),
+    }
+    return {k: [v for v in vs if v] for k, vs in values.items()}
+
+def tags_hash(entry: Entry) -> str:
+    """what would get written, files only need retagging when this changes"""
+    return hashlib.sha1(json.dumps(_tag_values(entry), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def write_tags(file: str, entry: Entry) -> bool:
+    """false when the format is not supported"""
+    try:
+        audio = mutagen.File(file, easy=True)
+        if audio is None:
+            logger.debug(f"can't tag '{file}', unknown format")
+            return False
+        if audio.tags is None:
+            audio.add_tags()
+
+        for key, values in _tag_values(entry).items():
+            if values:
+                audio.tags[key] = values
+            elif key in audio.tags:
+                del audio.tags[key]
+        audio.save()
+    except mutagen.MutagenError as e:
+        logger.error(f"failed to tag '{file}': {e}")
+        return False
+    return True
+
 def worktree_load(directory: str) -> list[Entry]:
     logger.debug("loading working tree")
 
     output = []
-    for file in os.listdir(directory):
-        if not os.path.isfile(file):
-            continue
-
-        entry = Entry()
-        #filename = os.fsdecode(file)
-        parts = file.rsplit(".", maxsplit=2)
-        if len(parts) != 3:
-            logger.debug(f"skipping file '{file}'")
-            continue
+    with os.scandir(directory) as it:
+        for file in it:
+            if not file.is_file() or not _is_candidate(file.name):
+                continue
 
-        entry.id = parts[1]
-        entry.title = parts[0]
+            parsed = parse_name(file.name)
+            if parsed is None:
+                logger.debug(f"skipping file '{file.name}'")
+                continue
 
-        # TODO: extract tags here
+            entry = Entry()
+            entry.title, entry.id = parsed
 
-        output.append(entry)
+            output.append(entry)
 
     return output
+
+_FLAG_SCANNED = 1
+
+# slots, there is one per file
+@dataclass(slots=True)
+class IndexEntry:
+    path: str
+    id: str | None
+    size: int
+    mtime_ns: int
+    inode: int
+    flags: int = 0
+    # embedded tags once scanned
+    title: str | None = None
+    artist: str | None = None
+    genre: str | None = None
+    # of the last write by mist
+    tags_hash: str | None = None
+
+    @property
+    def scanned(self) -> bool:
+        return bool(self.flags & _FLAG_SCANNED)
+
+    def same_stat(self, st: os.stat_result) -> bool:
+        return self.size == st.st_size and self.mtime_ns == st.st_mtime_ns and self.inode == st.st_ino
+
+    def apply_tags(self, tags: FileTags | None):
+        self.flags |= _FLAG_SCANNED
+        if tags is None:
+            return
+        # name wins, tags are for files which got renamed
+        self.id = self.id or tags.id
+        self.title = tags.title
+        self.artist = tags.artist
+        self.genre = tags.genre
+
+    def to_entry(self) -> Entry:
+        parsed = parse_name(self.path)
+        return Entry(id=self.id,
+                     title=self.title or (parsed[0] if parsed else os.path.splitext(self.path)[0]),
+                     artist_name=self.artist,
+                     genre=self.genre)
+
+_INDEX_MAGIC = b"MIDX"
+_INDEX_VERSION = 3
+# magic, version, entry count
+_INDEX_HEADER = struct.Struct("<4sII")
+# string fields are stored after all the records in a single blob, their lengths are in characters of the decoded blob
+_INDEX_STRINGS = ("path", "id", "title", "artist", "genre", "tags_hash")
+# size, mtime_ns, inode, flags, string lengths
+_INDEX_RECORD = struct.Struct("<qqQI" + "I" * len(_INDEX_STRINGS))
+
+class WorktreeIndex:
+    """
+    stat data and embedded tags of worktree files, like the git index
+
+    files are matched by name and only looked at again once their stat data changes
+    """
+
+    def __init__(self, file: str):
+        self.file = file
+        self.entries: dict[str, IndexEntry] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.file):
+            return
+
+        with open(self.file, "rb") as f:
+            data = f.read()
+
+        magic, version, count = _INDEX_HEADER.unpack_from(data, 0)
+        if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+            # gets rebuilt by the next refresh
+            logger.debug(f"ignoring index version {version}")
+            return
+
+        records_end = _INDEX_HEADER.size + count * _INDEX_RECORD.size
+        strings = data[records_end:].decode("utf-8", "surrogateescape")
+
+        offset = 0
+        for size, mtime_ns, inode, flags, *lengths in _INDEX_RECORD.iter_unpack(data[_INDEX_HEADER.size:records_end]):
+            values = []
+            for length in lengths:
+                values.append(strings[offset:offset + length] or None)
+                offset += length
+            path, entry_id, title, artist, genre, hash_ = values
+
+            self.entries[path] = IndexEntry(path, entry_id, size, mtime_ns, inode, flags, title, artist, genre, hash_)
+
+    def save(self):
+        records = [_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, len(self.entries))]
+        strings = []
+        for e in self.entries.values():
+            values = [getattr(e, name) or "" for name in _INDEX_STRINGS]
+            records.append(_INDEX_RECORD.pack(e.size, e.mtime_ns, e.inode, e.flags, *map(len, values)))
+            strings.extend(values)
+        records.append("".join(strings).encode("utf-8", "surrogateescape"))
+
+        write_atomic(self.file, records, binary=True)
+
+    def refresh(self, directory: str, stat: bool = True) -> bool:
+        """
+        brings the index up to date with the directory, tells whether anything changed
+
+        without stat the recorded data of files which are still there is trusted, enough to find out what is missing
+        """
+        changed = False
+        present = set()
+
+        with os.scandir(directory) as it:
+            for file in it:
+                if not _is_candidate(file.name) or not file.is_file():
+                    continue
+                present.add(file.name)
+
+                known = self.entries.get(file.name)
+                if known is not None and not stat:
+                    continue
+
+                st = file.stat()
+                if known is not None and known.same_stat(st):
+                    continue
+
+                parsed = parse_name(file.name)
+                self.entries[file.name] = IndexEntry(file.name, parsed[1] if parsed else None,
+                                                     st.st_size, st.st_mtime_ns, st.st_ino)
+                changed = True
+
+        for gone in self.entries.keys() - present:
+            del self.entries[gone]
+            changed = True
+
+        return changed
+
+    def scan_tags(self, directory: str, unidentified_only: bool = False, max_workers: int | None = None) -> int:
+        """reads embedded tags of files not scanned since they changed, returns how many were read"""
+        pending = [e for e in self.entries.values() if not e.scanned and (e.id is None or not unidentified_only)]
+        if not pending:
+            return 0
+
+        logger.debug(f"reading tags of {len(pending)} files")
+        # mostly waiting for the disk, mutagen only reads the headers
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or min(32, (os.cpu_count() or 1) * 4),
+                                                   thread_name_prefix="mist-tags") as executor:
+            for e, tags in zip(pending, executor.map(read_tags, (os.path.join(directory, e.path) for e in pending))):
+                e.apply_tags(tags)
+
+        return len(pending)
+
+    def mark_written(self, directory: str, path: str, entry: Entry):
+        """stat data of a file mist just tagged, so it does not look changed"""
+        st = os.stat(os.path.join(directory, path))
+        parsed = parse_name(path)
+        e = IndexEntry(path, parsed[1] if parsed else entry.id, st.st_size, st.st_mtime_ns, st.st_ino)
+        e.apply_tags(FileTags(id=entry.id, title=entry.title, artist=entry.artist_name, genre=entry.genre))
+        e.tags_hash = tags_hash(entry)
+        self.entries[path] = e
+
+    def ids(self) -> set[str]:
+        return {e.id for e in self.entries.values() if e.id}
+
+    def to_entries(self) -> list[Entry]:
+        return [e.to_entry() for e in self.entries.values() if e.id is not None]
+
+class TagWriter:
+    """writes entry metadata into files in the background, written ones are collected for the index"""
+
+    def __init__(self, max_concurrency: int | None = None):
+        self.written: dict[str, Entry] = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency or os.cpu_count() or 1,
+                                                               thread_name_prefix="mist-tag")
+
+    def submit(self, file: str, entry: Entry) -> concurrent.futures.Future:
+        """resolves to whether the file got written"""
+        return self._executor.submit(self._write, file, entry)
+
+    def _write(self, file: str, entry: Entry) -> bool:
+        # whatever goes wrong is reported here, the futures only tell what got written
+        try:
+            if write_tags(file, entry):
+                self.written[file] = entry
+                return True
+        except Exception as e:
+            logger.error(f"failed to tag '{file}'\n{type(e).__name__}: {e}")
+            logger.debug(e, exc_info=e)
+        return False
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is KeyboardInterrupt:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self.close()
@@ -1,14 +1,12 @@
 import functools
 import json
-from http.client import RemoteDisconnected
 from pprint import pprint
 from typing import Any
 
 import microdata
-import requests
 from lxml import etree
 
-from . import MetadataConnector, Source, NotSupported
+from . import MetadataConnector, Source, NotSupported, TrackBundle, net
 from ..log import spawn_logger
 from .scrape_utils import json_dict_of_key, json_path_get, extract_script_data, RateLimitHitError, assert_status_code
 
@@ -107,7 +105,14 @@ def _parse_link(link) -> str:
     link = vm["link"]["content"]
     return link
 
-@functools.cache
+def _has_video_details(response) -> bool:
+    # throttled ones are a 200 as well, just without the details
+    try:
+        return "videoDetails" in response.json()
+    except ValueError:
+        return False
+
+# not memoized, track bundles fetch it once per track anyway
 def _get_ytm_player_data(video_id):
     json_data = {
         "videoId": video_id,
@@ -116,11 +121,8 @@ def _get_ytm_player_data(video_id):
         },
     }
 
-    try:
-        response = requests.post(URL_POST_YOUTUBE_MUSIC_TITLE, json=json_data)
-    except RemoteDisconnected:
-        logger.error("getting throttled")
-        raise RateLimitHitError
+    # disconnects get retried and reported by net
+    response = net.post(URL_POST_YOUTUBE_MUSIC_TITLE, json=json_data, validate=_has_video_details)
     assert_status_code(response)
 
     response_data = response.json()
@@ -129,7 +131,7 @@ def _get_ytm_player_data(video_id):
 
 @functools.cache
 def _get_yt_video_data(video_id):
-    response = requests.get(URL_GET_YOUTUBE_VIDEO.format(video_id=video_id))
+    response = net.get(URL_GET_YOUTUBE_VIDEO.format(video_id=video_id))
     assert_status_code(response)
 
     tree = etree.HTML(response.content)
@@ -138,11 +140,7 @@ def _get_yt_video_data(video_id):
 
 @functools.cache
 def _get_yt_channel_data(channel_id):
-    try:
-        response = requests.get(URL_GET_YOUTUBE_CHANNEL.format(channel_id=channel_id))
-    except RemoteDisconnected:
-        logger.error("getting throttled")
-        raise RateLimitHitError
+    response = net.get(URL_GET_YOUTUBE_CHANNEL.format(channel_id=channel_id))
     assert_status_code(response)
 
     tree = etree.HTML(response.content)
@@ -164,11 +162,7 @@ def _get_yt_channel_description_data(channel_id):
         "continuation": token
     }
 
-    try:
-        response = requests.post(URL_POST_YOUTUBE_LINKS, json=json_data)
-    except RemoteDisconnected:
-        logger.error("getting throttled")
-        raise RateLimitHitError
+    response = net.post(URL_POST_YOUTUBE_LINKS, json=json_data)
     assert_status_code(response)
 
     return response.json()
@@ -178,72 +172,97 @@ def _expect_unexpected(response):
         raise RateLimitHitError
     assert_status_code(response)
 
+YtVideoId = str
+YtChannelId = str
+
+def _get_yt_watch_page(video_id) -> bytes:
+    response = net.get(URL_GET_YOUTUBE_VIDEO.format(video_id=video_id))
+    _expect_unexpected(response)
+    return response.content
+
+def _watch_page_tags(content: bytes) -> list[str]:
+    data = microdata.get_items(content)[0]
+    return data.keywords.split(",") if data.keywords else None
+
+def _watch_page_channel_id(content: bytes) -> YtChannelId:
+    tree = etree.HTML(content)
+    data = extract_script_data(tree, "var ytInitialPlayerResponse = ")
+    return data["videoDetails"]["channelId"]
+
+def _ytm_title(response_data) -> str:
+    if "videoDetails" not in response_data:
+        logger.error("getting throttled, i guess?")
+        if _DUMP_UNEXPECTED_DATA:
+            logger.debug(json.dumps(response_data, indent=2))
+        net.slow_down(URL_HOST_YOUTUBE_MUSIC)
+        raise RateLimitHitError
+
+    details = response_data["videoDetails"]
+    microformat = response_data["microformat"]
+
+    owner = microformat["microformatDataRenderer"]["pageOwnerDetails"]["name"]
+
+    if owner.endswith(" - Topic"):
+        owner = owner.removesuffix(" - Topic")  # fuck topics
+        logger.debug("owner is topic")
+
+    if details["author"] not in details["title"]:
+        title = f"""{details["author"]} - {details["title"]}"""
+    else:
+        title = details["title"]
+
+    if owner not in details["author"]:
+        title += f" [{owner}]"
+
+    logger.debug(f"final title is '{title}'")
+    return title
+
 def canonicalize_channel_id(channel_url) -> str:
-    response = requests.get(channel_url)
+    response = net.get(channel_url)
     assert_status_code(response)
 
     data = microdata.get_items(response.content)[0]
     # more data can be found in breadcrumbs
     return data.properties.url
 
-YtVideoId = str
-YtChannelId = str
-
 class YouTubeConnector(MetadataConnector[YtVideoId, YtChannelId]):
     source = Source.YOUTUBE
 
-    def get_track_name(self, track: YtVideoId) -> str:
-        raise NotSupported
-
-    # TODO: lang
-    def get_track_title(self, track: YtVideoId) -> str:
-        response_data = _get_ytm_player_data(track)
-
-        if "videoDetails" not in response_data:
-            logger.error("getting throttled, i guess?")
-            if _DUMP_UNEXPECTED_DATA:
-                logger.debug(json.dumps(response_data, indent=2))
-            raise RateLimitHitError
+    def get_track_bundle(self, track: YtVideoId) -> TrackBundle:
+        bundle = TrackBundle()
 
-        details = response_data["videoDetails"]
-        microformat = response_data["microformat"]
+        bundle.collect("title", lambda: self.get_track_title(track))
 
-        owner = microformat["microformatDataRenderer"]["pageOwnerDetails"]["name"]
+        # tags and channel come from the same watch page
+        try:
+            page = _get_yt_watch_page(track)
+        except Exception as e:
+            bundle.fail(e, "tags", "artist")
+        else:
+            bundle.collect("tags", lambda: _watch_page_tags(page))
+            bundle.collect("artist", lambda: _watch_page_channel_id(page))
 
-        if owner.endswith(" - Topic"):
-            owner = owner.removesuffix(" - Topic")  # fuck topics
-            logger.debug("owner is topic")
+        if bundle.artist:
+            self.collect_artist(bundle)
 
-        if details["author"] not in details["title"]:
-            title = f"""{details["author"]} - {details["title"]}"""
-        else:
-            title = details["title"]
+        return bundle
 
-        if owner not in details["author"]:
-            title += f" [{owner}]"
+    def get_track_name(self, track: YtVideoId) -> str:
+        raise NotSupported
 
-        logger.debug(f"final title is '{title}'")
-        return title
+    # TODO: lang
+    def get_track_title(self, track: YtVideoId) -> str:
+        return _ytm_title(_get_ytm_player_data(track))
 
     def get_track_tags(self, track: YtVideoId) -> list[str]:
         #raise NotSupported # i don't believe in ass
-
-        response = requests.get(URL_GET_YOUTUBE_VIDEO.format(video_id=track))
-        _expect_unexpected(response)
-
-        data = microdata.get_items(response.content)[0]
-        return data.keywords.split(",") if data.keywords else None
+        return _watch_page_tags(_get_yt_watch_page(track))
 
     def get_track_genre(self, track: YtVideoId) -> str:
         raise NotSupported
 
     def get_artist(self, track: YtVideoId) -> YtChannelId:
-        response = requests.get(URL_GET_YOUTUBE_VIDEO.format(video_id=track))
-        _expect_unexpected(response)
-
-        tree = etree.HTML(response.content)
-        data = extract_script_data(tree, "var ytInitialPlayerResponse = ")
-        return data["videoDetails"]["channelId"]
+        return _watch_page_channel_id(_get_yt_watch_page(track))
 
     def get_artist_name(self, artist: YtChannelId) -> str:
         raise NotSupported
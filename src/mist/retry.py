@@ -0,0 +1,91 @@
+import glob
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+
+from . import Entry
+from .log import spawn_logger
+from .utils import write_atomic
+
+logger = spawn_logger(__name__)
+
+_VERSION = 1
+# longest wait between attempts
+_MAX_DELAY = 24 * 60 * 60
+
+DEFAULT_RETRY_DELAY = 60
+DEFAULT_MAX_ATTEMPTS = 5
+
+@dataclass
+class QueuedDownload:
+    remote: str
+    id: str
+    title: str = None
+    attempts: int = 0
+    next_attempt: float = 0
+    error: str = None
+    part: str = None
+
+    def entry(self) -> Entry:
+        return Entry(id=self.id, title=self.title)
+
+def find_part(directory: str, entry_id: str) -> str | None:
+    """partial download left behind by yt-dlp, named like the finished one"""
+    parts = glob.glob(os.path.join(glob.escape(directory), f"*.{glob.escape(entry_id)}.*.part"))
+    return parts[0] if parts else None
+
+class DownloadQueue:
+    """
+    failed and partial downloads that should be tried again, persisted in the repository
+
+    attempts back off exponentially, partial files get continued by yt-dlp since the naming is stable
+    """
+
+    def __init__(self, file: str, retry_delay: float = DEFAULT_RETRY_DELAY, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.file = file
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.items: dict[tuple[str, str], QueuedDownload] = {}
+
+        if os.path.isfile(file):
+            with open(file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            assert data.get("version") == _VERSION, f"unknown download queue version {data.get('version')}"
+            for record in data["items"]:
+                item = QueuedDownload(**record)
+                self.items[(item.remote, item.id)] = item
+
+    def save(self):
+        if not self.items:
+            if os.path.isfile(self.file):
+                os.remove(self.file)
+            return
+
+        data = {"version": _VERSION, "items": [asdict(i) for i in self.items.values()]}
+        write_atomic(self.file, [json.dumps(data, indent=1)])
+
+    def fail(self, remote: str, entry: Entry, error: str | None, part: str | None = None, count: bool = True):
+        """count is off for interrupted downloads, those did not really fail"""
+        item = self.items.setdefault((remote, entry.id), QueuedDownload(remote, entry.id))
+        item.title = entry.title
+        item.error = error
+        item.part = part
+        if count:
+            item.attempts += 1
+            item.next_attempt = time.time() + min(self.retry_delay * 2 ** (item.attempts - 1), _MAX_DELAY)
+
+        logger.debug(f"queued '{entry.id}' for retry, attempt {item.attempts}")
+
+    def done(self, remote: str, entry_id: str):
+        self.items.pop((remote, entry_id), None)
+
+    def due(self, remote: str) -> list[Entry]:
+        now = time.time()
+        return [i.entry() for i in self.items.values() if i.remote == remote and i.next_attempt <= now]
+
+    def blocked(self, remote: str) -> set[str]:
+        """ids which are waiting for their backoff or gave up already"""
+        now = time.time()
+        return {i.id for i in self.items.values()
+                if i.remote == remote and (i.next_attempt > now or i.attempts >= self.max_attempts)}
@@ -1,14 +1,19 @@
 import concurrent.futures
+import multiprocessing
 import os
+import signal
+import threading
 from dataclasses import dataclass
-from typing import Callable
+from typing import Callable, Iterable, Iterator
 from urllib.parse import urlsplit
 
 from yt_dlp import YoutubeDL, DownloadError
 from pprint import pprint, pformat
 import re
 
+from .errors import MistError
 from .log import spawn_logger
+from .messages import MSG_LISTING_FAILED
 from .metadata import Source
 from .utils import strip_ansi, sanitize_filename
 from . import Entry
@@ -100,8 +105,11 @@ options_download: dict = {
     "logger": BaseLogger(),
     "extract_audio": True,
     "format": "bestaudio",
+    # retried downloads pick up their .part files
+    "continuedl": True,
 
-    "outtmpl": "%(title)s.%(id)s.%(ext)s",
+    # mist_name is passed along with every item, fixed name if available
+    "outtmpl": "%(mist_name,title)s.%(id)s.%(ext)s",
 }
 
 def get_playlist_title(url: str) -> str:
@@ -114,52 +122,80 @@ def get_playlist_title(url: str) -> str:
     assert info["_type"] == "playlist"
     return info["title"]
 
-def get_entries(url: str, progress: Callable[[str], None] = None, max_concurrency: int | None = None) -> list[Entry]:
+def get_entries(url: str, progress: Callable[[str], None] = None, max_concurrency: int | None = None,
+                on_entry: Callable[[Entry], None] = None) -> list[Entry]:
+    """listing and enrichment run as a pipeline, tracks get enriched as soon as their page is listed"""
+    return enrich_entries(url, iter_entries(url, progress=progress), max_concurrency=max_concurrency, on_entry=on_entry)
+
+def enrich_entries(url: str, entries: Iterable[Entry], max_concurrency: int | None = None,
+                   on_entry: Callable[[Entry], None] = None) -> list[Entry]:
+    """on_entry gets every enriched entry as soon as it is done"""
     if max_concurrency is not None:
         logger.debug(f"concurrency: {max_concurrency}")
 
-    entries = get_entries_fast(url, progress=progress)
+    listed: list[Entry] = []
+    by_id: dict[str, Entry] = {}
+
+    def ids():
+        for e in entries:
+            listed.append(e)
+            by_id.setdefault(e.id, e)
+            yield e.id
 
-    def metadata_collection(e: Entry):
-        from . import metadata
-        oe = metadata.obtain(metadata.detect_source(url), e.id)
+    def finish(e: Entry, oe: Entry | None) -> Entry:
+        if oe is None:
+            # at least what the listing knows
+            return e
         oe.id = e.id
         return oe
 
-    output = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
-        futures = [executor.submit(metadata_collection, e) for e in entries]
+    def collected(entry_id: str, oe: Entry | None):
+        if on_entry:
+            on_entry(finish(by_id[entry_id], oe))
 
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                output.append(future.result())
-            except concurrent.futures.TimeoutError:
-                logger.error("this took too long...")
+    from . import metadata
+    results = metadata.obtain_many(metadata.detect_source(url), ids(),
+                                   max_in_flight=max_concurrency, on_result=collected)
 
-    return output
+    return [finish(e, oe) for e, oe in zip(listed, results)]
 
-def get_entries_fast(url: str, progress: Callable[[str], None] = None) -> list[Entry]:
+def iter_entries(url: str, progress: Callable[[str], None] = None) -> Iterator[Entry]:
+    """flat entries as the playlist pages arrive, pages are only requested as the entries get consumed"""
     opts = dict(options_entries_flat)
     if progress:
         logger.debug("progress callback will be used")
         opts["logger"] = YtPageProgressLogger(progress)
 
-
-    opts["progress_hooks"] = [_emtpy_hook],
-
     try:
         with YoutubeDL(opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+            # unprocessed result keeps the extractor's lazy entries instead of collecting them all
+            info = ydl.extract_info(url, download=False, process=False)
+            while info["_type"] in ("url", "url_transparent"):
+                info = ydl.extract_info(info["url"], download=False, process=False, ie_key=info.get("ie_key"))
+
+            assert info["_type"] == "playlist"
+            for e in info["entries"]:
+                if _DUMP_DATA:
+                    logger.debug(pformat(e))
+                yield extract_flat_entry(e)
     except DownloadError as e:
-        print(e)
-
-    assert info["_type"] == "playlist"
-    if _DUMP_DATA:
-        logger.debug(pformat(info))
-    output = []
-    for e in info["entries"]:
-        output.append(extract_flat_entry(e))
-    return output
+        # an empty listing would look like everything got removed
+        raise MistError(MSG_LISTING_FAILED.format(url=url, error=strip_ansi(str(e)))) from e
+
+def iter_entries_incremental(url: str, known: set[str], stop_after: int,
+                             progress: Callable[[str], None] = None) -> Iterator[Entry]:
+    """new entries up to the first run of stop_after already known ones, only makes sense for newest first playlists"""
+    run = 0
+    for entry in iter_entries(url, progress=progress):
+        if entry.id in known:
+            run += 1
+            if run >= stop_after:
+                logger.debug(f"stopping after {run} known entries")
+                break
+            continue
+
+        run = 0
+        yield entry
 
 def get_item(url: str, progress: Callable) -> str:
     raise NotImplementedError
@@ -176,42 +212,204 @@ def extract_flat_entry(e: dict) -> Entry:
 
     return entry
 
-def download_entries(platform: Source, entries: list[Entry], destination_dir: str, max_concurrency: int | None = None):
-    logger.debug(f"destination: {destination_dir}")
-    if max_concurrency is not None:
-        logger.debug(f"concurrency: {max_concurrency}")
-
+def new_downloader(destination_dir: str, on_progress: Callable[[dict], None] = None) -> YoutubeDL:
     opts = dict(options_download)
+    opts["paths"] = {"home": destination_dir}
+    if on_progress:
+        opts["progress_hooks"] = [lambda d: on_progress(_progress_status(d))]
+    return YoutubeDL(opts)
+
+def _progress_status(d: dict) -> dict:
+    # small and picklable, the whole info dict stays where it is
+    return {
+        "id": d.get("info_dict", {}).get("id"),
+        "status": d["status"],
+        "downloaded_bytes": d.get("downloaded_bytes"),
+        "total_bytes": d.get("total_bytes") or d.get("total_bytes_estimate"),
+    }
+
+def download_item(ydl: YoutubeDL, platform: Source, item: Entry) -> dict:
+    """downloads a single entry with a reusable downloader, the name goes in with the item instead of the options"""
+    from . import metadata
+    url = metadata.url_source(platform, item.id)
+
+    extra_info = {}
+    if item.title:
+        extra_info["mist_name"] = sanitize_filename(item.title)
+
+    return ydl.extract_info(url, download=True, extra_info=extra_info)
+
+def _download_task(ydl: YoutubeDL, platform: Source, item: Entry) -> dict:
+    """picklable outcome, error message when it failed or the downloaded file"""
+    try:
+        info = download_item(ydl, platform, item)
+    except DownloadError as e:
+        logger.debug(e, exc_info=e)
+        return {"error": str(e), "file": None}
+
+    downloads = info.get("requested_downloads") or [{}]
+    return {"error": None, "file": downloads[0].get("filepath")}
+
+# state of a download worker process
+_worker_ydl: YoutubeDL | None = None
+
+def _process_worker_init(destination_dir: str, progress_queue, pids):
+    # parent takes care of interrupts, workers just get stopped
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pids.put(os.getpid())
+
+    global _worker_ydl
+    _worker_ydl = new_downloader(destination_dir, on_progress=progress_queue.put if progress_queue else None)
+
+def _process_download(platform: Source, item: Entry) -> dict:
+    return _download_task(_worker_ydl, platform, item)
+
+DOWNLOAD_BACKENDS = {"thread", "process"}
+
+class DownloadPool:
+    """
+    downloads entries in the background, submitting blocks while too many of them are waiting
+
+    thread backend shares the interpreter, process one gets around the gil for cpu heavy extraction
+    """
+
+    def __init__(self, platform: Source, destination_dir: str,
+                 max_concurrency: int | None = None,
+                 max_pending: int | None = None,
+                 backend: str = "thread",
+                 on_progress: Callable[[dict], None] = None,
+                 on_downloaded: Callable[[Entry, str], None] = None):
+        logger.debug(f"destination: {destination_dir}")
+        if max_concurrency is not None:
+            logger.debug(f"concurrency: {max_concurrency}")
+        if backend not in DOWNLOAD_BACKENDS:
+            raise ValueError(f"unknown download backend '{backend}'")
+
+        self.platform = platform
+        self.destination_dir = destination_dir
+        self.backend = backend
+        self.on_progress = on_progress
+        # next stage, gets downloaded entries along with their files
+        self.on_downloaded = on_downloaded
+        self.succeeded: list[Entry] = []
+        self.failed: list[Entry] = []
+        self.errors: dict[str, str] = {}
+
+        workers = max_concurrency or os.cpu_count() or 1
+        # running ones count as pending too
+        self._pending = threading.BoundedSemaphore(max_pending or workers * 2)
+        self._futures: list[tuple[Entry, concurrent.futures.Future]] = []
+
+        self._progress_queue = None
+        self._progress_thread = None
+
+        if backend == "process":
+            # forking a process with running threads (sessions, other pools, the asyncio loop) can deadlock the child
+            context = multiprocessing.get_context("spawn")
+            if on_progress:
+                self._progress_queue = context.Queue()
+                self._progress_thread = threading.Thread(target=self._forward_progress, name="mist-download-progress")
+                self._progress_thread.start()
+            # workers report in, so an interrupt can stop the running ones
+            self._worker_pids = context.SimpleQueue()
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                                    mp_context=context,
+                                                                    initializer=_process_worker_init,
+                                                                    initargs=(destination_dir, self._progress_queue,
+                                                                              self._worker_pids))
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mist-download")
 
-    def download_item(item: Entry):
-        lopts = dict(opts)
-
-        # use fixed name if available
-        if item.title:
-            lopts["outtmpl"] = f"{sanitize_filename(item.title)}.%(id)s.%(ext)s"
-        lopts["outtmpl"] = os.path.join(destination_dir, lopts["outtmpl"])
-
-        from . import metadata
-        url = metadata.url_source(platform, item.id)
-
-        try:
-            with YoutubeDL(lopts) as ydl:
-                ydl.download([url])
-        except DownloadError as e:
-            log.error(f"filed to download entry '{item.id}': {e}")
-            log.exception(e)
-
-
-        # TODO: tag
-
-    output = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
-        futures = [executor.submit(download_item, e) for e in entries]
+        # one downloader per worker thread, setting one up is not cheap
+        self._local = threading.local()
+        self._downloaders: list[YoutubeDL] = []
+        self._downloaders_lock = threading.Lock()
 
-        for future in concurrent.futures.as_completed(futures):
+    def submit(self, item: Entry):
+        self._pending.acquire()
+        if self.backend == "process":
+            future = self._executor.submit(_process_download, self.platform, item)
+        else:
+            future = self._executor.submit(self._download, item)
+        future.add_done_callback(lambda f: self._finished(item, f))
+        self._futures.append((item, future))
+
+    def _downloader(self) -> YoutubeDL:
+        ydl = getattr(self._local, "ydl", None)
+        if ydl is None:
+            ydl = self._local.ydl = new_downloader(self.destination_dir, on_progress=self.on_progress)
+            with self._downloaders_lock:
+                self._downloaders.append(ydl)
+        return ydl
+
+    def _download(self, item: Entry) -> dict:
+        return _download_task(self._downloader(), self.platform, item)
+
+    def _finished(self, item: Entry, future: concurrent.futures.Future):
+        self._pending.release()
+
+        if future.cancelled():
+            return
+        # anything besides a yt-dlp error (broken worker, os errors) goes the same way
+        if (exception := future.exception()) is not None:
+            result = {"error": str(exception) or type(exception).__name__, "file": None}
+        else:
+            result = future.result()
+        if result["error"]:
+            log.error(f"filed to download entry '{item.id}': {result['error']}")
+            self.failed.append(item)
+            self.errors[item.id] = result["error"]
+            return
+
+        self.succeeded.append(item)
+        if self.on_downloaded and result["file"]:
+            self.on_downloaded(item, result["file"])
+
+    def _forward_progress(self):
+        while (status := self._progress_queue.get()) is not None:
+            self.on_progress(status)
+
+    def wait(self) -> list[Entry]:
+        """downloaded entries in order of submission"""
+        output = []
+        for item, future in self._futures:
+            if future.exception() is None and future.result()["error"] is None:
+                output.append(item)
+        return output
+
+    def unfinished(self) -> list[Entry]:
+        """cancelled or still running ones"""
+        return [item for item, future in self._futures if not future.done() or future.cancelled()]
+
+    def close(self, interrupted: bool = False):
+        if interrupted:
+            logger.debug("cancelling downloads")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if self.backend == "process":
+                # running downloads would otherwise hold the exit, their parts get continued next time
+                self._terminate_workers()
+        self._executor.shutdown(wait=True)
+
+        for ydl in self._downloaders:
+            ydl.close()
+        self._downloaders.clear()
+
+        if self._progress_thread:
+            self._progress_queue.put(None)
+            self._progress_thread.join()
+            self._progress_thread = None
+
+    def _terminate_workers(self):
+        while not self._worker_pids.empty():
+            pid = self._worker_pids.get()
             try:
-                output.append(future.result())
-            except concurrent.futures.TimeoutError:
-                logger.error("this took too long...")
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                # done already
+                pass
+
+    def __enter__(self):
+        return self
 
-    return output
\ No newline at end of file
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(interrupted=exc_type is KeyboardInterrupt)
@@ -0,0 +1,84 @@
+import concurrent.futures
+import os
+import shutil
+import subprocess
+
+from .errors import MistError
+from .log import spawn_logger
+from .messages import MSG_FFMPEG_NOT_FOUND, MSG_UNKNOWN_CODEC
+
+logger = spawn_logger(__name__)
+
+# codec name => (ffmpeg encoder, extension, container), temporary files say nothing so ffmpeg is told the container
+CODECS: dict[str, tuple[str, str, str]] = {
+    "mp3": ("libmp3lame", "mp3", "mp3"),
+    "opus": ("libopus", "opus", "opus"),
+    "vorbis": ("libvorbis", "ogg", "ogg"),
+    "aac": ("aac", "m4a", "ipod"),
+    "flac": ("flac", "flac", "flac"),
+}
+
+def target_file(file: str, codec: str) -> str:
+    base, _ = os.path.splitext(file)
+    return f"{base}.{CODECS[codec][1]}"
+
+def check(codec: str):
+    """raises when files can't be converted to codec, before anything gets downloaded"""
+    if codec not in CODECS:
+        raise MistError(MSG_UNKNOWN_CODEC.format(codec=codec))
+    if shutil.which("ffmpeg") is None:
+        raise MistError(MSG_FFMPEG_NOT_FOUND)
+
+class Transcoder:
+    """
+    converts downloaded files on its own, so cpu heavy ffmpeg runs don't hold download slots
+
+    every job is a separate ffmpeg process, the threads only wait for them,
+    jobs say what they are converted to so remotes of different repositories can share one
+    """
+
+    def __init__(self, max_concurrency: int | None = None):
+        workers = max_concurrency or os.cpu_count() or 1
+        logger.debug(f"transcoding with {workers} processes")
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mist-transcode")
+
+    def submit(self, file: str, codec: str, bitrate: str | None = None) -> concurrent.futures.Future:
+        """resolves to the converted file, None when ffmpeg failed, see check for what to call first"""
+        return self._executor.submit(self._transcode, file, codec, bitrate)
+
+    def _transcode(self, file: str, codec: str, bitrate: str | None) -> str | None:
+        output = target_file(file, codec)
+        if output == file:
+            return file
+
+        encoder, _, container = CODECS[codec]
+        # same naming as partial downloads
+        temporary = f"{output}.part"
+        command = [shutil.which("ffmpeg"), "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+                   "-i", file, "-vn", "-map_metadata", "0", "-c:a", encoder]
+        if bitrate:
+            command += ["-b:a", bitrate]
+        command += ["-f", container, temporary]
+
+        logger.debug(f"transcoding '{file}'")
+        process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if process.returncode != 0:
+            logger.error(f"failed to transcode '{file}': {process.stderr.strip()}")
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return None
+
+        os.replace(temporary, output)
+        os.remove(file)
+        return output
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is KeyboardInterrupt:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self.close()
@@ -1,11 +1,12 @@
 import os
+import tempfile
 from functools import wraps
 from typing import AnyStr, Callable
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 from textwrap import dedent, indent
 import re
 
-from . import log
+from . import log, files
 
 def url_strip_utm(url: str) -> AnyStr:
     utm_parameters = {"utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content"}
@@ -43,6 +44,26 @@ def indent_list(ls: list) -> str:
     # safe function with fallback
     return indent("\n".join(ls) if ls else "", " " * 4)
 
+def user_cache_dir() -> str:
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, files.DIR_USER_CACHE)
+
+def write_atomic(file: str, lines: list[str] | list[bytes], binary: bool = False):
+    """temp file in the same directory and rename, readers see either the old or the new file"""
+    fd, temp = tempfile.mkstemp(prefix=os.path.basename(file), suffix=".tmp", dir=os.path.dirname(file) or ".")
+    try:
+        with (os.fdopen(fd, "wb") if binary else os.fdopen(fd, "w", encoding="utf-8")) as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, file)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
 def strip_ansi(text):
     return re.sub(r'\033\[[0-9;]*m', '', text)
 
@@ -0,0 +1,20 @@
+from mist.config import ConfigReader
+from .. import TempDirTestCase
+
+
+class TestConfig(TempDirTestCase):
+    def test_save_load(self):
+        settings = {
+            "core.downloadBackend": "process",
+            "cache.maxSize": "64",
+            "download.maxAttempts": "3",
+            "remote.origin.url": "https://www.youtube.com/playlist?list=PL",
+            "remote.origin.skipFetchAll": "true",
+        }
+        ConfigReader(dict(settings), "config").save()
+
+        reader = ConfigReader(path="config")
+        reader.load()
+
+        self.assertEqual(reader.settings, settings)
+        self.assertTrue(reader.getbool("remote.origin.skipFetchAll"))
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from yt_dlp import DownloadError
+
+from mist import Entry, retry, shenanigans
+from mist.metadata import Source
+from .. import TempDirTestCase
+
+
+class TestFindPart(TempDirTestCase):
+    def test_find(self):
+        for name in ["Track.abc.webm.part", "Track.abcd.webm.part", "Other.abc.webm"]:
+            open(name, "w").close()
+
+        self.assertEqual(retry.find_part(".", "abc"), os.path.join(".", "Track.abc.webm.part"))
+        self.assertIsNone(retry.find_part(".", "xyz"))
+
+    def test_glob_characters(self):
+        open("Track.[a]*.webm.part", "w").close()
+
+        self.assertIsNotNone(retry.find_part(".", "[a]*"))
+        self.assertIsNone(retry.find_part(".", "a"))
+
+
+class TestDownloadQueue(TempDirTestCase):
+    def test_backoff(self):
+        queue = retry.DownloadQueue("queue", retry_delay=10, max_attempts=5)
+
+        with mock.patch.object(time, "time", return_value=1000):
+            queue.fail("origin", Entry(id="a"), "broken")
+            queue.fail("origin", Entry(id="a"), "broken")
+            queue.fail("origin", Entry(id="a"), "interrupted", count=False)
+
+        item = queue.items[("origin", "a")]
+        self.assertEqual(item.attempts, 2)
+        self.assertEqual(item.next_attempt, 1000 + 20)
+        self.assertEqual(item.error, "interrupted")
+
+    def test_max_delay(self):
+        queue = retry.DownloadQueue("queue", retry_delay=10 ** 6)
+
+        with mock.patch.object(time, "time", return_value=0):
+            queue.fail("origin", Entry(id="a"), "broken")
+
+        self.assertEqual(queue.items[("origin", "a")].next_attempt, retry._MAX_DELAY)
+
+    def test_due_blocked(self):
+        queue = retry.DownloadQueue("queue", retry_delay=10, max_attempts=2)
+        with mock.patch.object(time, "time", return_value=1000):
+            queue.fail("origin", Entry(id="a"), "broken")
+            queue.fail("origin", Entry(id="b"), "broken")
+            queue.fail("origin", Entry(id="b"), "broken")
+            queue.fail("other", Entry(id="c"), "broken")
+
+        with mock.patch.object(time, "time", return_value=1005):
+            self.assertEqual(queue.due("origin"), [])
+            self.assertEqual(queue.blocked("origin"), {"a", "b"})
+
+        with mock.patch.object(time, "time", return_value=1100):
+            self.assertEqual([e.id for e in queue.due("origin")], ["a", "b"])
+            # out of attempts stays blocked for regular pulls
+            self.assertEqual(queue.blocked("origin"), {"b"})
+
+    def test_save_load(self):
+        queue = retry.DownloadQueue("queue")
+        queue.fail("origin", Entry(id="a", title="A"), "broken", part="A.a.webm.part")
+        queue.fail("origin", Entry(id="b"), "broken")
+        queue.done("origin", "b")
+        queue.save()
+
+        loaded = retry.DownloadQueue("queue")
+        self.assertEqual(list(loaded.items.values()), list(queue.items.values()))
+
+        loaded.done("origin", "a")
+        loaded.save()
+        self.assertFalse(os.path.exists("queue"))
+
+
+class FakeYoutubeDL:
+    """downloads are empty files, ids starting with x fail and ones starting with e break"""
+
+    def __init__(self, opts):
+        self.home = opts["paths"]["home"]
+        self.closed = False
+
+    def extract_info(self, url, download=True, extra_info=None):
+        entry_id = url.rsplit("=", 1)[1]
+        if entry_id.startswith("x"):
+            raise DownloadError(f"{entry_id} is gone")
+        if entry_id.startswith("e"):
+            raise OSError(f"{entry_id} is broken")
+        file = os.path.join(self.home, f"{extra_info['mist_name']}.{entry_id}.mp3")
+        open(file, "w").close()
+        return {"requested_downloads": [{"filepath": file}]}
+
+    def close(self):
+        self.closed = True
+
+
+class TestDownloadPool(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(shenanigans, "YoutubeDL", FakeYoutubeDL)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_download(self):
+        entries = [Entry(id=i, title=f"Track {i}") for i in ["a", "x1", "b", "e1", "c", "x2"]]
+        downloaded = {}
+        lock = threading.Lock()
+
+        def on_downloaded(item: Entry, file: str):
+            with lock:
+                downloaded[item.id] = file
+
+        with shenanigans.DownloadPool(Source.YOUTUBE, os.getcwd(), max_concurrency=2, max_pending=2,
+                                      on_downloaded=on_downloaded) as pool:
+            for e in entries:
+                pool.submit(e)
+            result = pool.wait()
+
+        self.assertEqual([e.id for e in result], ["a", "b", "c"])
+        self.assertEqual({e.id for e in pool.succeeded}, {"a", "b", "c"})
+        self.assertEqual({e.id for e in pool.failed}, {"x1", "e1", "x2"})
+        self.assertIn("gone", pool.errors["x1"])
+        self.assertIn("broken", pool.errors["e1"])
+        self.assertFalse(pool.unfinished())
+        self.assertEqual(set(downloaded), {"a", "b", "c"})
+        self.assertTrue(all(os.path.isfile(f) for f in downloaded.values()))
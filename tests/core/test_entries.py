@@ -0,0 +1,80 @@
+import os
+
+from mist import Entry
+from mist.metadata import local
+
+from .. import TempDirTestCase
+
+def _sample(count: int = 3) -> list[Entry]:
+    return [Entry(id=f"id{i}", title=f"title {i}", name=f"name {i}", tags=[f"tag{i}", "common"], genre="genre") for i in range(count)]
+
+class TestEntriesStore(TempDirTestCase):
+    def _roundtrip(self, backend: str):
+        store = local.open_store(".", backend)
+        self.assertFalse(store.exists())
+        self.assertIsNone(store.load())
+
+        entries = _sample()
+        store.save(entries)
+        loaded = store.load()
+
+        self.assertEqual([e.id for e in loaded], [e.id for e in entries])
+        for a, b in zip(loaded, entries):
+            self.assertEqual(a.title, b.title)
+            self.assertEqual(a.genre, b.genre)
+            self.assertEqual(set(a.tags), set(b.tags))
+
+        # removed ones are gone
+        store.save(entries[1:])
+        self.assertEqual([e.id for e in store.load()], [e.id for e in entries[1:]])
+
+        # put keeps positions of known entries and appends the rest
+        store.put([Entry(id="id0", title="back", tags=["x"]), Entry(id="id1", title="changed", tags=["y"])])
+        loaded = store.load()
+        self.assertEqual([e.id for e in loaded], ["id1", "id2", "id0"])
+        self.assertEqual(loaded[0].title, "changed")
+        self.assertEqual(loaded[0].tags, ["y"])
+
+    def test_ini(self):
+        self._roundtrip("ini")
+
+    def test_sqlite(self):
+        self._roundtrip("sqlite")
+
+    def test_journal(self):
+        self._roundtrip("journal")
+
+    def test_journal_delta(self):
+        entries = _sample(10)
+        store = local.open_store(".", "journal")
+        store.save(entries)
+        size = os.path.getsize(store.journal_file)
+
+        entries[3].title = "changed"
+        entries.insert(0, Entry(id="new", title="new"))
+        store.save(entries)
+        store.wait()
+
+        # fresh instance replays the journal
+        loaded = local.open_store(".", "journal").load()
+        self.assertEqual([e.id for e in loaded], [e.id for e in entries])
+        self.assertEqual(loaded[4].title, "changed")
+        self.assertLess(os.path.getsize(store.journal_file) - size, size)
+
+    def test_journal_compaction(self):
+        entries = _sample(600)
+        store = local.open_store(".", "journal")
+        store.save(entries)
+        store.wait()
+
+        self.assertEqual(os.path.getsize(store.journal_file), 0)
+        self.assertEqual(len(local.open_store(".", "journal").load()), len(entries))
+
+    def test_migration(self):
+        entries = _sample()
+        local.open_store(".", "ini").save(entries)
+
+        store = local.open_store(".", "sqlite")
+
+        self.assertEqual([e.id for e in store.load()], [e.id for e in entries])
+        self.assertFalse(os.path.exists(local.IniEntriesStore(".").file))
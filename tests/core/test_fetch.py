@@ -0,0 +1,275 @@
+import os
+import subprocess
+import unittest
+from unittest import mock
+
+from yt_dlp import DownloadError
+
+from mist import Entry, Mist, MistError, _merge_entries, shenanigans, transcode
+from mist.metadata import worktree
+from . import MistTest
+
+
+class TestMergeEntries(unittest.TestCase):
+    def test_order(self):
+        cached = [Entry(id="b", title="B"), Entry(id="c", title="C")]
+        fetched = [Entry(id="a", title="A"), Entry(id="b", title="B"), Entry(id="c", title="C")]
+
+        merged, diff = _merge_entries(cached, fetched, is_fast=True, ignore_tags=True)
+
+        self.assertEqual([e.id for e in merged], ["a", "b", "c"])
+        self.assertEqual(diff.added, ["a"])
+        self.assertEqual(diff.unchanged, ["b", "c"])
+        self.assertFalse(diff.updated or diff.removed)
+
+    def test_removed_kept(self):
+        cached = [Entry(id="a"), Entry(id="b")]
+        fetched = [Entry(id="a")]
+
+        merged, diff = _merge_entries(cached, fetched, is_fast=True, ignore_tags=True)
+
+        self.assertEqual([e.id for e in merged], ["a", "b"])
+        self.assertEqual(diff.removed, ["b"])
+
+    def test_removed_pruned(self):
+        cached = [Entry(id="a"), Entry(id="b")]
+        fetched = [Entry(id="a")]
+
+        merged, diff = _merge_entries(cached, fetched, prune=True)
+
+        self.assertEqual([e.id for e in merged], ["a"])
+        self.assertEqual(diff.removed, ["b"])
+
+    def test_updated(self):
+        cached = [Entry(id="a", title="old", tags=["x"])]
+        fetched = [Entry(id="a", title="new", tags=["x", "y"])]
+
+        merged, diff = _merge_entries(cached, fetched)
+
+        self.assertEqual(merged[0].title, "new")
+        self.assertEqual(diff.updated, ["a"])
+        # snapshot stays untouched
+        self.assertEqual(cached[0].title, "old")
+
+    def test_tags_removed(self):
+        cached = [Entry(id="a", tags=["x", "y"])]
+        fetched = [Entry(id="a", tags=["x"])]
+
+        self.assertRaises(MistError, _merge_entries, cached, fetched)
+
+        merged, diff = _merge_entries(cached, fetched, prune_tags=True)
+        self.assertEqual(merged[0].tags, ["x"])
+
+    def test_duplicates(self):
+        fetched = [Entry(id="a", title="first"), Entry(id="a", title="second")]
+
+        merged, diff = _merge_entries([], fetched)
+
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(merged[0].title, "first")
+
+    def test_partial(self):
+        cached = [Entry(id="b"), Entry(id="c")]
+        fetched = [Entry(id="a")]
+
+        merged, diff = _merge_entries(cached, fetched, is_fast=True, ignore_tags=True, partial=True)
+
+        self.assertEqual([e.id for e in merged], ["a", "b", "c"])
+        self.assertEqual(diff.added, ["a"])
+        self.assertEqual(diff.unchanged, ["b", "c"])
+        self.assertFalse(diff.removed)
+
+
+class TestIncremental(unittest.TestCase):
+    def incremental(self, listed: str, known: str, stop_after: int) -> tuple[str, str]:
+        consumed = []
+
+        def iter_entries(url, progress=None):
+            for i in listed:
+                consumed.append(i)
+                yield Entry(id=i)
+
+        with mock.patch.object(shenanigans, "iter_entries", iter_entries):
+            output = list(shenanigans.iter_entries_incremental("url", set(known), stop_after))
+        return "".join(e.id for e in output), "".join(consumed)
+
+    def test_stop(self):
+        self.assertEqual(self.incremental("abcdef", "cdef", 2), ("ab", "abcd"))
+
+    def test_run_reset(self):
+        # known ones in between do not count towards the run
+        self.assertEqual(self.incremental("acbdefg", "cdefg", 3), ("ab", "acbdef"))
+
+    def test_nothing_known(self):
+        self.assertEqual(self.incremental("abc", "", 1), ("abc", "abc"))
+
+    def test_nothing_new(self):
+        self.assertEqual(self.incremental("abc", "abc", 1), ("", "a"))
+
+
+class FailingYoutubeDL:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def extract_info(self, *args, **kwargs):
+        raise DownloadError("playlist does not exist")
+
+
+class DownloadingYoutubeDL(FailingYoutubeDL):
+    """downloads are a few silent mpeg frames"""
+
+    def __init__(self, opts):
+        self.home = opts["paths"]["home"]
+
+    def extract_info(self, url, download=True, extra_info=None):
+        entry_id = url.rsplit("=", 1)[1]
+        file = os.path.join(self.home, f"{extra_info['mist_name']}.{entry_id}.mp3")
+        with open(file, "wb") as f:
+            f.write((b"\xff\xfb\x90\x64" + b"\x00" * 413) * 8)
+        return {"requested_downloads": [{"filepath": file}]}
+
+    def close(self):
+        pass
+
+
+class TestFetch(MistTest):
+    def setUp(self):
+        super().setUp()
+
+        self.mist.init(".")
+        self.mist.set_working_dir(os.getcwd())
+        self.mist.remote_add("origin", "https://www.youtube.com/playlist?list=PLmissing")
+        self.cached = [Entry(id=str(i), title=f"Track {i}") for i in range(5)]
+        self.mist._get_entries_store("origin").save(self.cached)
+
+    def test_listing_failed(self):
+        for tags in (False, True):
+            with self.subTest(tags=tags), mock.patch.object(shenanigans, "YoutubeDL", FailingYoutubeDL):
+                self.assertRaises(MistError, self.mist.fetch, "origin", tags=tags, prune=True)
+
+                # a failed listing must not look like an empty playlist
+                self.assertEqual([e.id for e in self.mist.get_remote_entries("origin")], [e.id for e in self.cached])
+
+    def fetch_listed(self, listed: list[str], **kwargs):
+        consumed = []
+
+        def iter_entries(url, progress=None):
+            for i in listed:
+                consumed.append(i)
+                yield Entry(id=i, title=f"Track {i}")
+
+        with mock.patch.object(shenanigans, "iter_entries", iter_entries):
+            return self.mist.fetch("origin", **kwargs), consumed
+
+    def test_incremental_newest_first(self):
+        self.mist.config.local.set("remote.origin.newestFirst", "true")
+        self.mist.config.local.set("fetch.incrementalStopAfter", "2")
+        self.mist.config.local.save()
+
+        result, consumed = self.fetch_listed(["a", "b"] + [e.id for e in self.cached], incremental=True)
+
+        self.assertEqual(result.diff.added, ["a", "b"])
+        self.assertEqual(consumed, ["a", "b", "0", "1"])
+        self.assertEqual([e.id for e in result.entries], ["a", "b", "0", "1", "2", "3", "4"])
+
+    def test_incremental_on_entry(self):
+        self.mist.config.local.set("remote.origin.newestFirst", "true")
+        self.mist.config.local.save()
+
+        # entries are handed over as they are listed, not once the listing is done
+        listed = []
+        seen = []
+
+        def iter_entries(url, progress=None):
+            for i in ["a", "b"] + [e.id for e in self.cached]:
+                listed.append(i)
+                yield Entry(id=i, title=f"Track {i}")
+
+        with mock.patch.object(shenanigans, "iter_entries", iter_entries):
+            self.mist.fetch("origin", incremental=True, on_entry=lambda e: seen.append((e.id, len(listed))))
+
+        self.assertEqual(seen, [("a", 1), ("b", 2)])
+
+    def test_incremental_oldest_first(self):
+        self.mist.config.local.set("fetch.incrementalStopAfter", "2")
+        self.mist.config.local.save()
+
+        # new ones at the bottom would never be reached by stopping early
+        result, consumed = self.fetch_listed([e.id for e in self.cached] + ["a", "b"], incremental=True)
+
+        self.assertEqual(result.diff.added, ["a", "b"])
+        self.assertEqual(len(consumed), 7)
+
+    def test_pull_tags_cached(self):
+        self.cached[0].genre = "genre"
+        self.cached[0].artist_name = "artist"
+        self.mist._get_entries_store("origin").save(self.cached)
+
+        with mock.patch.object(shenanigans, "YoutubeDL", DownloadingYoutubeDL):
+            # plain listing knows nothing about genres
+            def iter_entries(url, progress=None):
+                yield Entry(id="0", title="Track 0")
+
+            with mock.patch.object(shenanigans, "iter_entries", iter_entries):
+                downloaded = self.mist.pull("origin")
+
+        self.assertEqual([e.id for e in downloaded], [e.id for e in self.cached])
+        tags = worktree.read_tags("Track 0.0.mp3")
+        self.assertEqual((tags.id, tags.genre, tags.artist), ("0", "genre", "artist"))
+
+    def test_pull_transcode_failed(self):
+        self.mist.config.local.set("transcode.codec", "opus")
+        self.mist.config.local.save()
+
+        failed = subprocess.CompletedProcess([], returncode=1, stderr="unsupported")
+        with mock.patch.object(shenanigans, "YoutubeDL", DownloadingYoutubeDL), \
+                mock.patch.object(shenanigans, "iter_entries", lambda url, progress=None: iter([])), \
+                mock.patch.object(transcode.shutil, "which", return_value="ffmpeg"), \
+                mock.patch.object(transcode.subprocess, "run", return_value=failed):
+            self.mist.pull("origin")
+
+        # downloaded but not converted, so not done yet
+        queued = self.mist._get_download_queue().items
+        self.assertEqual({i.id for i in queued.values()}, {e.id for e in self.cached})
+        self.assertTrue(all(i.error == "transcoding failed" for i in queued.values()))
+
+    def test_pull_many_shared_stages(self):
+        self.mist.remote_add("mirror", "https://www.youtube.com/playlist?list=PLmirror")
+        self.mist._get_entries_store("mirror").save([Entry(id="5", title="Track 5")])
+
+        with mock.patch.object(shenanigans, "YoutubeDL", DownloadingYoutubeDL), \
+                mock.patch.object(shenanigans, "iter_entries", lambda url, progress=None: iter([])), \
+                mock.patch.object(Mist, "_tag_writer", autospec=True, side_effect=Mist._tag_writer) as tag_writer:
+            results = self.mist.pull_many(["origin", "mirror"])
+
+        # cpu heavy stages are sized for the whole machine, not for every remote
+        self.assertEqual(tag_writer.call_count, 1)
+        self.assertEqual(len(results["origin"]) + len(results["mirror"]), 6)
+        self.assertEqual(len(self.mist.ls_files()), 6)
+        self.assertEqual(worktree.read_tags("Track 5.5.mp3").id, "5")
+
+
+class TestSyncAll(MistTest):
+    def test_shared_stages(self):
+        for directory in ["a", "b"]:
+            mist = Mist()
+            mist.init(directory)
+            mist.set_working_dir(os.path.abspath(directory))
+            mist.remote_add("origin", f"https://www.youtube.com/playlist?list=PL{directory}")
+            mist._get_entries_store("origin").save([Entry(id=directory, title=f"Track {directory}")])
+
+        with mock.patch.object(shenanigans, "YoutubeDL", DownloadingYoutubeDL), \
+                mock.patch.object(shenanigans, "iter_entries", lambda url, progress=None: iter([])), \
+                mock.patch.object(Mist, "_tag_writer", autospec=True, side_effect=Mist._tag_writer) as tag_writer:
+            summaries = self.mist.sync_all(".")
+
+        # one set of cpu limits for every repository
+        self.assertEqual(tag_writer.call_count, 1)
+        self.assertEqual([s.remotes[0].downloaded for s in summaries], [1, 1])
+        self.assertEqual(worktree.read_tags(os.path.join("b", "Track b.b.mp3")).id, "b")
@@ -1,5 +1,6 @@
 import os
 
+from mist import Mist, find_repositories
 from . import MistTest
 
 class TestInit(MistTest):
@@ -10,3 +11,12 @@ class TestInit(MistTest):
     def test_other_dir(self):
         self.mist.init("./yeet")
         self.assertTrue(os.path.isdir(self.mist.repository_dir))
+
+    def test_find_repositories(self):
+        for directory in ["a", "b/c", "b/d"]:
+            Mist().init(directory)
+        # repositories are not looked into
+        Mist().init("a/nested")
+
+        found = [os.path.relpath(d) for d in find_repositories(".")]
+        self.assertEqual(found, ["a", os.path.join("b", "c"), os.path.join("b", "d")])
@@ -0,0 +1,203 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from mist import metadata
+from mist.metadata import MetadataConnector, Source, TrackBundle, net, sc
+
+
+class BulkConnector(MetadataConnector[str, str]):
+    source = Source.BANDCAMP
+    bulk_size = 10
+
+    def __init__(self):
+        self.bulk_calls: list[list[str]] = []
+        self.single_calls: list[str] = []
+        self._lock = threading.Lock()
+
+    def get_tracks_bulk(self, tracks: list[str]) -> dict[str, TrackBundle]:
+        with self._lock:
+            self.bulk_calls.append(tracks)
+        return {t: TrackBundle(title=f"bulk {t}") for t in tracks}
+
+    def get_track_bundle(self, track: str) -> TrackBundle:
+        with self._lock:
+            self.single_calls.append(track)
+        return TrackBundle(title=f"single {track}")
+
+    def get_track_name(self, track): pass
+    def get_track_title(self, track): pass
+    def get_track_tags(self, track): pass
+    def get_track_genre(self, track): pass
+    def get_artist(self, track): pass
+    def get_artist_name(self, artist): pass
+    def get_artist_links(self, artist): pass
+    def get_artist_tags(self, artist): pass
+
+
+def slow_listing(count: int):
+    for i in range(count):
+        # pages trickle in, the queue is empty most of the time
+        time.sleep(0.002)
+        yield str(i)
+
+
+class TestObtainMany(unittest.TestCase):
+    def setUp(self):
+        self.connector = BulkConnector()
+        patcher = mock.patch.dict(metadata.connectors.nodes, {Source.BANDCAMP: self.connector})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bulk_chunks(self):
+        results = metadata.obtain_many(Source.BANDCAMP, slow_listing(25), max_in_flight=4)
+
+        self.assertEqual([len(c) for c in self.connector.bulk_calls], [10, 10, 5])
+        self.assertFalse(self.connector.single_calls)
+        self.assertEqual([r.title for r in results], [f"bulk {i}" for i in range(25)])
+
+    def test_blocking_on_result(self):
+        self.connector.bulk_size = 0
+        listed = [str(i) for i in range(8)]
+
+        def obtained(item, result):
+            # like a saturated download pool, enrichment has to keep going meanwhile
+            deadline = time.monotonic() + 5
+            while len(self.connector.single_calls) < len(listed):
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+
+        results = metadata.obtain_many(Source.BANDCAMP, listed, max_in_flight=2, on_result=obtained)
+
+        self.assertEqual([r.title for r in results], [f"single {i}" for i in listed])
+
+    def test_order(self):
+        self.connector.bulk_size = 0
+        listed = [str(i) for i in range(12)]
+        original = self.connector.get_track_bundle
+
+        def slow_first(track: str) -> TrackBundle:
+            # first ones finish last
+            time.sleep(0.005 * (len(listed) - int(track)))
+            return original(track)
+
+        collected = []
+        with mock.patch.object(self.connector, "get_track_bundle", slow_first):
+            results = metadata.obtain_many(Source.BANDCAMP, iter(listed), max_in_flight=4,
+                                           on_result=lambda item, result: collected.append(item))
+
+        self.assertEqual([r.title for r in results], [f"single {i}" for i in listed])
+        self.assertEqual(sorted(collected, key=int), listed)
+
+    def test_bulk_fallback(self):
+        original = self.connector.get_tracks_bulk
+
+        def partial(tracks: list[str]) -> dict[str, TrackBundle]:
+            # odd ones are missing from the response
+            return {t: b for t, b in original(tracks).items() if int(t) % 2 == 0}
+
+        with mock.patch.object(self.connector, "get_tracks_bulk", partial):
+            results = metadata.obtain_many(Source.BANDCAMP, [str(i) for i in range(6)], max_in_flight=2)
+
+        self.assertEqual([r.title for r in results], ["bulk 0", "single 1", "bulk 2", "single 3", "bulk 4", "single 5"])
+
+    def test_bulk_failed(self):
+        with mock.patch.object(self.connector, "get_tracks_bulk", side_effect=RuntimeError("down")), \
+                self.assertLogs("mist.metadata", "ERROR"):
+            results = metadata.obtain_many(Source.BANDCAMP, [str(i) for i in range(3)], max_in_flight=2)
+
+        self.assertEqual([r.title for r in results], [f"single {i}" for i in range(3)])
+        self.assertEqual(sorted(self.connector.single_calls), ["0", "1", "2"])
+
+    def test_failed_entry(self):
+        self.connector.bulk_size = 0
+
+        with mock.patch.object(metadata, "_obtain_async", side_effect=RuntimeError("broken")), \
+                self.assertLogs("mist.metadata", "ERROR"):
+            results = metadata.obtain_many(Source.BANDCAMP, ["0", "1"], max_in_flight=2)
+
+        self.assertEqual(results, [None, None])
+
+
+class NamedConnector(BulkConnector):
+    bulk_size = 0
+
+    def __init__(self, source: Source):
+        super().__init__()
+        self.source = source
+
+
+class TestObtain(unittest.TestCase):
+    def setUp(self):
+        self.nodes = {s: NamedConnector(s) for s in (Source.YOUTUBE, Source.LASTFM, Source.SOUNDCLOUD)}
+        self.matched: list[tuple[Source, Source]] = []
+
+        def link(source: Source, target: Source) -> metadata.ConnectorLink:
+            def matcher(data: metadata.Data):
+                self.matched.append((source, target))
+                return f"{target.name} track"
+            return metadata.ConnectorLink(self.nodes[source], self.nodes[target], matcher)
+
+        links = [link(Source.YOUTUBE, Source.LASTFM), link(Source.LASTFM, Source.SOUNDCLOUD),
+                 link(Source.YOUTUBE, Source.SOUNDCLOUD)]
+        for name, value in [("nodes", self.nodes), ("links", links)]:
+            patcher = mock.patch.object(metadata.connectors, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_walk(self):
+        track = metadata.obtain(Source.YOUTUBE, "abc")
+
+        self.assertEqual(track.title, "single abc")
+        self.assertEqual(self.nodes[Source.YOUTUBE].single_calls, ["abc"])
+        self.assertEqual(self.nodes[Source.LASTFM].single_calls, ["lastfm track"])
+        # matched from youtube already, last.fm does not get to match it again
+        self.assertEqual(self.nodes[Source.SOUNDCLOUD].single_calls, ["soundcloud track"])
+        self.assertNotIn((Source.LASTFM, Source.SOUNDCLOUD), self.matched)
+        self.assertEqual(track.visited, {"youtube", "lastfm", "soundcloud"})
+
+
+class TestSoundCloudClientId(unittest.TestCase):
+    def setUp(self):
+        self.scraped = 0
+        self.requested: list[str] = []
+        self._lock = threading.Lock()
+
+        for target, name, value in [(sc, "_scrape_client_id", self.scrape), (sc.net, "get", self.get),
+                                    (sc.net, "cache_dir", lambda: None), (sc, "_client_id", "stale")]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def scrape(self) -> str:
+        with self._lock:
+            self.scraped += 1
+            return f"fresh{self.scraped}"
+
+    def get(self, url, params=None, **kwargs) -> requests.Response:
+        with self._lock:
+            self.requested.append(params["client_id"])
+        response = requests.Response()
+        response.status_code = 401 if params["client_id"] == "stale" else 200
+        return response
+
+    def test_rejected(self):
+        sc._wrap_request_with_client_id(sc.URL_API_GET_TRACKS.format(track_id=1))
+
+        self.assertEqual(self.requested, ["stale", "fresh1"])
+        self.assertEqual(sc._client_id, "fresh1")
+
+    def test_rejected_once(self):
+        threads = [threading.Thread(target=sc._wrap_request_with_client_id, args=(sc.URL_API_GET_TRACKS.format(track_id=i),))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # late ones get the already refreshed id
+        self.assertEqual(self.scraped, 1)
+        self.assertEqual(self.requested.count("fresh1"), 8)
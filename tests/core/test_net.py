@@ -0,0 +1,131 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from mist.config import ConfigReader
+from mist.metadata import net
+from .. import TempDirTestCase
+
+
+def response(url: str, body: bytes) -> requests.Response:
+    r = requests.Response()
+    r.status_code = 200
+    r.url = url
+    r._content = body
+    r.headers["Content-Type"] = "text/plain"
+    return r
+
+
+class TestResponseCache(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = net.ResponseCache("cache/http.db", 10 ** 6, {"youtube": 10}, default_ttl=100)
+        self.addCleanup(self.cache.close)
+
+    def test_key(self):
+        a = net.ResponseCache.key("get", "https://a", {"q": "x", "client_id": "1"}, None)
+        b = net.ResponseCache.key("GET", "https://a", {"client_id": "2", "q": "x"}, None)
+        c = net.ResponseCache.key("GET", "https://a", {"q": "y"}, None)
+
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_ttl(self):
+        youtube, other = "https://www.youtube.com/watch", "https://example.com"
+        with mock.patch.object(time, "time", return_value=1000):
+            self.cache.put("yt", response(youtube, b"yt"))
+            self.cache.put("other", response(other, b"other"))
+
+        with mock.patch.object(time, "time", return_value=1050):
+            self.assertIsNone(self.cache.get("yt", youtube))
+            cached = self.cache.get("other", other)
+            self.assertEqual(cached.content, b"other")
+            self.assertEqual(cached.headers["content-type"], "text/plain")
+
+        with mock.patch.object(time, "time", return_value=1101):
+            self.assertIsNone(self.cache.get("other", other))
+
+    def test_eviction(self):
+        url = "https://example.com"
+        body = bytes(range(256)) * 8
+        size = len(net.zlib.compress(body))
+        self.cache.max_size = size * 5
+
+        for i in range(6):
+            with mock.patch.object(time, "time", return_value=1000 + i):
+                self.cache.put(str(i), response(url, body))
+        # recently used ones stay
+        with mock.patch.object(time, "time", return_value=1010):
+            self.cache.get("0", url)
+
+        self.cache._evict()
+
+        with mock.patch.object(time, "time", return_value=1020):
+            kept = [str(i) for i in range(6) if self.cache.get(str(i), url) is not None]
+        self.assertEqual(kept, ["0", "3", "4", "5"])
+
+
+class TestConfigure(TempDirTestCase):
+    def tearDown(self):
+        net.configure(ConfigReader(), None)
+        super().tearDown()
+
+    def test_lazy_cache(self):
+        net.configure(ConfigReader(), "cache")
+        self.assertFalse(os.path.exists("cache"))
+
+        self.assertIsNotNone(net._response_cache())
+        self.assertTrue(os.path.isfile(os.path.join("cache", "http.db")))
+
+    def test_disabled(self):
+        net.configure(ConfigReader({"cache.enabled": "false"}), "cache")
+        self.assertIsNone(net._response_cache())
+
+        net.configure(ConfigReader(), "cache")
+        with net.cache_mode(enabled=False):
+            self.assertIsNone(net._response_cache())
+        self.assertFalse(os.path.exists("cache"))
+
+    def test_cache_mode_restored(self):
+        net.configure(ConfigReader(), "cache")
+        with net.cache_mode(refresh=True):
+            with net.cache_mode(enabled=False):
+                self.assertIsNone(net._response_cache())
+            self.assertIsNotNone(net._response_cache())
+            self.assertFalse(net._reads_cache())
+        self.assertTrue(net._reads_cache())
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst(self):
+        bucket = net.TokenBucket(rate=100, burst=3)
+        start = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.01)
+
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.005)
+
+    def test_unlimited(self):
+        bucket = net.TokenBucket(rate=0, burst=0)
+        for _ in range(1000):
+            bucket.acquire()
+
+    def test_slow_down_recover(self):
+        bucket = net.TokenBucket(rate=10, burst=10)
+
+        bucket.slow_down()
+        self.assertEqual(bucket.rate, 5)
+        self.assertLessEqual(bucket.tokens, 0)
+
+        for _ in range(100):
+            bucket.slow_down()
+        self.assertEqual(bucket.rate, 10 * net._MIN_RATE_FRACTION)
+
+        for _ in range(100):
+            bucket.recover()
+        self.assertEqual(bucket.rate, 10)
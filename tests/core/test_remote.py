@@ -24,3 +24,9 @@ class TestRemote(MistTest):
         self.mist.remote_add("origin", "https://music.youtube.com/playlist?list=PL0LVK5Sb2wOeYQdrUjaGW2SjgMS_sZ8lB")
         self.mist.remote_set_url("origin", "crazy hamburger")
         self.assertTrue(self.mist.remote_get_url("origin"))
+
+    def test_skip_fetch_all(self):
+        self.mist.remote_add("origin", "https://music.youtube.com/playlist?list=PL0LVK5Sb2wOeYQdrUjaGW2SjgMS_sZ8lB")
+        self.mist.remote_add("other", "https://music.youtube.com/playlist?list=PL0LVK5Sb2wOeYQdrUjaGW2SjgMS_sZ8lC")
+        self.mist.config.local.set("remote.other.skipFetchAll", "true")
+        self.assertEqual(self.mist.get_fetch_all_remotes(), ["origin"])
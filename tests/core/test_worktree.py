@@ -0,0 +1,96 @@
+import os
+
+from mist.metadata import worktree
+
+from .. import TempDirTestCase
+
+class TestWorktreeIndex(TempDirTestCase):
+    def _touch(self, name: str, content: str = ""):
+        with open(os.path.join("tree", name), "w") as f:
+            f.write(content)
+
+    def setUp(self):
+        super().setUp()
+        os.mkdir("tree")
+        self._touch("a title.id1.m4a")
+        self._touch("b.id2.opus")
+        self._touch("unnamed.mp3")
+        self._touch("c.id3.m4a.part")
+        self._touch(".hidden")
+
+    def test_refresh(self):
+        index = worktree.WorktreeIndex("index")
+        self.assertTrue(index.refresh("tree"))
+        index.save()
+
+        index = worktree.WorktreeIndex("index")
+        self.assertEqual(index.ids(), {"id1", "id2"})
+        self.assertEqual(set(index.entries), {"a title.id1.m4a", "b.id2.opus", "unnamed.mp3"})
+        self.assertFalse(index.refresh("tree"))
+
+        self._touch("b.id2.opus", "changed")
+        os.remove(os.path.join("tree", "unnamed.mp3"))
+        self.assertTrue(index.refresh("tree"))
+        self.assertEqual(index.entries["b.id2.opus"].size, len("changed"))
+        self.assertNotIn("unnamed.mp3", index.entries)
+
+    def test_names_only(self):
+        index = worktree.WorktreeIndex("index")
+        index.refresh("tree")
+
+        # content changes are not looked for, new files are
+        self._touch("b.id2.opus", "changed")
+        self.assertFalse(index.refresh("tree", stat=False))
+        self._touch("d.id4.m4a")
+        self.assertTrue(index.refresh("tree", stat=False))
+        self.assertIn("id4", index.ids())
+
+    def test_tags(self):
+        from mutagen.easyid3 import EasyID3
+
+        # few silent mpeg frames are enough for mutagen
+        with open(os.path.join("tree", "renamed.mp3"), "wb") as f:
+            f.write((b"\xff\xfb\x90\x64" + b"\x00" * 413) * 8)
+        tags = EasyID3()
+        tags["title"] = "title"
+        tags[worktree.TAG_ID] = "id5"
+        tags.save(os.path.join("tree", "renamed.mp3"))
+
+        index = worktree.WorktreeIndex("index")
+        index.refresh("tree")
+        # the rest has ids in their names already
+        self.assertEqual(index.scan_tags("tree", unidentified_only=True), 2)
+        self.assertEqual(index.entries["renamed.mp3"].id, "id5")
+        index.save()
+
+        index = worktree.WorktreeIndex("index")
+        self.assertFalse(index.refresh("tree"))
+        self.assertEqual(index.scan_tags("tree", unidentified_only=True), 0)
+        self.assertEqual(index.entries["renamed.mp3"].title, "title")
+
+    def test_write_tags(self):
+        from mist import Entry
+
+        file = os.path.join("tree", "t.id6.mp3")
+        with open(file, "wb") as f:
+            f.write((b"\xff\xfb\x90\x64" + b"\x00" * 413) * 8)
+
+        entry = Entry(id="id6", title="title", artist_name="artist", genre="genre", tags=["b", "a"])
+        self.assertTrue(worktree.write_tags(file, entry))
+        tags = worktree.read_tags(file)
+        self.assertEqual((tags.id, tags.title, tags.artist, tags.genre), ("id6", "title", "artist", "genre"))
+
+        # only what gets written matters
+        self.assertEqual(worktree.tags_hash(entry), worktree.tags_hash(Entry(id="id6", title="title", artist_name="artist", genre="genre", tags=["a", "b"], url="x")))
+        self.assertNotEqual(worktree.tags_hash(entry), worktree.tags_hash(Entry(id="id6", title="other")))
+
+    def test_tag_writer_errors(self):
+        from unittest import mock
+        from mist import Entry
+
+        with mock.patch.object(worktree, "write_tags", side_effect=PermissionError("read only")), \
+                self.assertLogs("mist.metadata.worktree", "ERROR"):
+            with worktree.TagWriter(max_concurrency=1) as tagger:
+                tagger.submit(os.path.join("tree", "b.id2.opus"), Entry(id="id2"))
+
+        self.assertFalse(tagger.written)